@@ -0,0 +1,259 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import threading
+import time
+
+import SmartMoveFinder
+from ChessUCI import moveToUci
+from Perft import BACKENDS, DEFAULT_BACKEND
+
+# Analyses a file of EPD or FEN positions on a pool of worker processes and writes one JSON line per
+# position. The input is read as it is needed rather than all at once, and a checkpoint file records
+# how far the output is complete, so an interrupted run carries on from there when started again.
+
+DEFAULT_DEPTH = 4
+# positions read ahead of the results written, per worker process
+READ_AHEAD = 16
+# the checkpoint is rewritten after this many results, and whenever this many seconds have passed
+CHECKPOINT_INTERVAL = 100
+CHECKPOINT_SECONDS = 10.0
+# random.shuffle in findBestMove is seeded so that a position gets the same answer on every run
+RANDOM_SEED = 0
+
+# state of each worker process --> set up once by initWorker and reused for every position
+workerState = None
+
+
+def parseRecord(line):
+    """
+    Splits one line of EPD or FEN into the position and the EPD operations after it
+
+    :param line: a line such as 'r1bqkbnr/... w KQkq - bm Nf3; id "test 1";' or a full FEN string
+    :return: a dictionary of the fen, the id (or None) and the other operations as text.
+    """
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("a position needs the board, side to move, castling and en passant fields: " + line)
+    fen = " ".join(fields[:4])
+    rest = fields[4] if len(fields) == 5 else ""
+    # a FEN string has the two move counters where an EPD record has its operations
+    counters = rest.split(None, 2)
+    if len(counters) >= 2 and counters[0].isdigit() and counters[1].isdigit():
+        fen += " %s %s" % (counters[0], counters[1])
+        rest = counters[2] if len(counters) == 3 else ""
+    operations = {}
+    for operation in rest.split(";"):
+        words = operation.strip().split(None, 1)
+        if words:
+            operations[words[0]] = words[1].strip().strip('"') if len(words) == 2 else ""
+    return {"fen": fen, "id": operations.pop("id", None), "operations": operations}
+
+
+def readRecords(path, skip=0):
+    """
+    Reads the positions of a file one at a time, leaving out blank lines and '#' comments
+
+    :param path: the EPD or FEN file
+    :param skip: the number of positions at the start of the file which have already been analysed
+    :return: a generator of (position number, line) pairs, numbered from 0.
+    """
+    with open(path) as f:
+        lines = (line.strip() for line in f)
+        records = (line for line in lines if line and not line.startswith("#"))
+        for index, line in enumerate(records):
+            if index >= skip:
+                yield index, line
+
+
+def initWorker(backend, depth, timeLimit, nodeLimit, hashSize, tablebasePath):
+    """Sets up a worker process --> its own game state, transposition table and tablebases"""
+    global workerState
+    # Ctrl+C is handled by the main process, which stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    SmartMoveFinder.transpositionTable = SmartMoveFinder.TranspositionTable(hashSize)
+    if tablebasePath is not None:
+        SmartMoveFinder.useTablebases(tablebasePath)
+    workerState = {"gs": BACKENDS[backend](), "depth": depth, "timeLimit": timeLimit, "nodeLimit": nodeLimit}
+
+
+def analysePosition(task):
+    """
+    Runs in a worker process and searches one position
+
+    :param task: a (position number, line) pair from readRecords
+    :return: the result dictionary written to the output for the position.
+    """
+    index, line = task
+    result = {"index": index}
+    try:
+        record = parseRecord(line)
+        result.update(id=record["id"], fen=record["fen"])
+        if record["operations"]:
+            result["operations"] = record["operations"]
+        gs = workerState["gs"]
+        gs.loadFen(record["fen"])
+    except (ValueError, KeyError) as e:
+        result["error"] = "bad position: %s" % e
+        return result
+
+    # every position is searched from an empty table so that its result does not depend on the order of the file
+    SmartMoveFinder.transpositionTable.clear()
+    random.seed(RANDOM_SEED)
+    validMoves = gs.getValidMoves()
+    if not validMoves:
+        result.update(move=None, result="checkmate" if gs.checkmate else "stalemate", depth=0, nodes=0, time=0.0)
+        return result
+    returnQueue = queue.Queue()
+    SmartMoveFinder.findBestMove(gs, validMoves, returnQueue, workerState["timeLimit"], workerState["nodeLimit"],
+                                 workerState["depth"])
+    move = returnQueue.get()
+    info = SmartMoveFinder.lastSearchInfo
+    if move is None:
+        # the time or node limit ran out before the search had any move to give
+        result.update(move=None, error="no move found within the limits", depth=info["depth"], nodes=info["nodes"],
+                      time=round(info["time"], 4))
+        return result
+    variation = [move]
+    gs.makeMove(move)
+    variation += SmartMoveFinder.getPrincipalVariation(gs, max(info["depth"] - 1, 0))
+    gs.undoMove()
+    # the score is from the point of view of the side to move
+    result.update(move=moveToUci(move), pv=" ".join(moveToUci(m) for m in variation), score=info["score"],
+                  depth=info["depth"], nodes=info["nodes"], time=round(info["time"], 4))
+    return result
+
+
+def readCheckpoint(path, settings):
+    """
+    Loads the checkpoint of an earlier run with the same input and settings
+
+    :param path: the checkpoint file
+    :param settings: the input file and search settings of this run
+    :return: the checkpoint dictionary, or None if there is no checkpoint.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint["settings"] != settings:
+        raise SystemExit("%s was written by a run with different settings (%s); use --restart to start again"
+                         % (path, checkpoint["settings"]))
+    return checkpoint
+
+
+def writeCheckpoint(path, settings, positions, outputBytes, complete=False):
+    # written to a temporary file and renamed over the old one, so a checkpoint is never half written
+    temporaryPath = path + ".tmp"
+    with open(temporaryPath, "w") as f:
+        json.dump({"settings": settings, "positions": positions, "outputBytes": outputBytes, "complete": complete}, f)
+    os.replace(temporaryPath, path)
+
+
+def runAnalysis(inputPath, outputPath, processes=None, backend=DEFAULT_BACKEND, depth=DEFAULT_DEPTH, timeLimit=None,
+                nodeLimit=None, hashSize=SmartMoveFinder.TT_SIZE_MB, tablebasePath=None, restart=False):
+    """
+    Analyses every position of the input file, carrying on from the checkpoint of an earlier run
+
+    :param inputPath: the EPD or FEN file, one position per line
+    :param outputPath: the JSONL file results are appended to
+    :param processes: the number of worker processes, or None for one per CPU
+    :param depth: the deepest iteration searched for each position
+    :param timeLimit: the seconds each position may take, or None for no limit
+    :param nodeLimit: the nodes each position may visit, or None for no limit
+    :param hashSize: the transposition table size of each worker in megabytes
+    :param tablebasePath: a directory of endgame tablebases, or None
+    :param restart: ignore any checkpoint and analyse the whole file again
+    :return: the number of positions analysed by this run.
+    """
+    processes = processes or os.cpu_count()
+    checkpointPath = outputPath + ".checkpoint"
+    settings = {"input": os.path.abspath(inputPath), "backend": backend, "depth": depth, "timeLimit": timeLimit,
+                "nodeLimit": nodeLimit}
+    checkpoint = None if restart else readCheckpoint(checkpointPath, settings)
+    if checkpoint is not None and checkpoint["complete"]:
+        print("%s is already complete (%d positions)" % (outputPath, checkpoint["positions"]))
+        return 0
+    done = checkpoint["positions"] if checkpoint is not None else 0
+    outputBytes = checkpoint["outputBytes"] if checkpoint is not None else 0
+
+    # results written after the last checkpoint are dropped, as their positions are analysed again
+    output = open(outputPath, "r+" if checkpoint is not None else "w")
+    output.seek(outputBytes)
+    output.truncate()
+
+    # Pool.imap reads its whole input straight away, so each position read waits for a free slot and
+    # a slot is given back as each result is written. Only a few positions per worker are in memory.
+    slots = threading.Semaphore(processes * READ_AHEAD)
+    stopping = threading.Event()
+
+    def tasks():
+        for task in readRecords(inputPath, done):
+            slots.acquire()
+            if stopping.is_set():
+                return
+            yield task
+
+    analysed = 0
+    nodes = 0
+    start = time.time()
+    lastCheckpoint = start
+    pool = multiprocessing.Pool(processes, initWorker, (backend, depth, timeLimit, nodeLimit, hashSize, tablebasePath))
+    try:
+        # imap gives the results back in the order of the file, so the output is always a complete prefix of it
+        for result in pool.imap(analysePosition, tasks()):
+            slots.release()
+            output.write(json.dumps(result) + "\n")
+            analysed += 1
+            nodes += result.get("nodes", 0)
+            if analysed % CHECKPOINT_INTERVAL == 0 or time.time() - lastCheckpoint >= CHECKPOINT_SECONDS:
+                output.flush()
+                writeCheckpoint(checkpointPath, settings, done + analysed, output.tell())
+                lastCheckpoint = time.time()
+                elapsed = lastCheckpoint - start
+                print("%d positions  %.1f positions/sec  %.0f nodes/sec" % (
+                    done + analysed, analysed / elapsed, nodes / elapsed))
+        output.flush()
+        writeCheckpoint(checkpointPath, settings, done + analysed, output.tell(), complete=True)
+    except KeyboardInterrupt:
+        output.flush()
+        writeCheckpoint(checkpointPath, settings, done + analysed, output.tell())
+        print("stopped after %d positions, run again to carry on" % (done + analysed))
+        raise SystemExit(1)
+    finally:
+        # the reading thread may be waiting for a slot, and has to finish before the pool can stop
+        stopping.set()
+        slots.release(processes * READ_AHEAD)
+        pool.terminate()
+        pool.join()
+        output.close()
+
+    elapsed = time.time() - start
+    print("analysed %d positions in %.1fs --> %.1f positions/sec, %.0f nodes/sec" % (
+        analysed, elapsed, analysed / elapsed if elapsed > 0 else 0.0, nodes / elapsed if elapsed > 0 else 0.0))
+    return analysed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a file of EPD or FEN positions on a process pool")
+    parser.add_argument("input", help="EPD or FEN file, one position per line")
+    parser.add_argument("output", help="JSONL file for the results")
+    parser.add_argument("--processes", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    parser.add_argument("--movetime", type=float, help="seconds per position")
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--hash", type=int, default=SmartMoveFinder.TT_SIZE_MB, help="megabytes of hash per worker")
+    parser.add_argument("--tablebases", help="directory of endgame tablebases")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the beginning")
+    args = parser.parse_args()
+    runAnalysis(args.input, args.output, args.processes, args.backend, args.depth, args.movetime, args.nodes, args.hash,
+                args.tablebases, args.restart)
+
+
+if __name__ == '__main__':
+    main()
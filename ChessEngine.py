@@ -1,4 +1,46 @@
-import copy
+import random
+
+# directions a piece can slide in, as (row change, column change)
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+# orthogonal directions first so that the index tells a rook line from a bishop line
+KING_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+KNIGHT_DIRECTIONS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+# castling rights are kept as a 4-bit number, one bit per right
+WHITE_KINGSIDE = 1
+BLACK_KINGSIDE = 2
+WHITE_QUEENSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING_RIGHTS = 15
+
+# FEN letters of the castling rights, in the order FEN lists them
+FEN_CASTLING = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+# what each character of a FEN rank puts on the board --> a piece, or a run of empty squares
+FEN_SQUARES = {char: [('w' if char.isupper() else 'b') + ('p' if char in 'pP' else char.upper())]
+               for char in 'PNBRQKpnbrqk'}
+FEN_SQUARES.update({str(n): ['--'] * n for n in range(1, 9)})
+FEN_PIECES = {squares[0]: char for char, squares in FEN_SQUARES.items() if squares[0] != '--'}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Undo stack. Each move pushes what makeMove cannot work out again from the Move itself:
+# castling rights, en passant square, Zobrist key, the two evaluation totals and the halfmove clock
+# from before the move. The stack is one flat preallocated list, so making a move does not create any new objects.
+UNDO_ENTRY_SIZE = 6
+UNDO_STACK_SIZE = 256  # entries allocated up front, doubled whenever a game gets longer
+
+# Zobrist keys --> one random 64-bit number per (piece, square), side to move, castling rights and
+# en passant file. XORing together the numbers for everything true of a position gives its key.
+# A fixed seed keeps the keys identical between runs and between processes.
+_zobristRandom = random.Random(20230601)
+ZOBRIST_PIECES = {colour + piece: [_zobristRandom.getrandbits(64) for sq in range(64)]
+                  for colour in 'wb' for piece in 'pRNBQK'}
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [_zobristRandom.getrandbits(64) for rights in range(16)]
+ZOBRIST_EN_PASSANT = [_zobristRandom.getrandbits(64) for col in range(8)]
+# when True every makeMove compares the incremental key with one computed from scratch
+ZOBRIST_DEBUG = False
+
 # This class is responsible for storing all information about the current state of a chess game
 # Will also be repsonsible for determining legal chess moves at the current state
 # A move log will be kept which enables recursion to be used to undo moves or display history of moves
@@ -7,11 +49,43 @@ import copy
 # bR=black rook, bN=black knight, bB=black bishop, bQ=black queen, bK=black king, bp=black pawn
 # wR=white rook, wN=white knight, wB=white bishop, wQ=white queen, wK=white king, wp=white pawn
 
+def squareAttackers(board, r, c, attackerColour):
+    """
+    Looks outwards from square (r,c) along slider rays, knight jumps, pawn diagonals and king steps
+    and returns the (row, col) of every piece of attackerColour which attacks it
+    """
+    attackers = []
+    # a pawn attacks diagonally forwards, so it is found one row behind the square from its point of view
+    pawnRow = 1 if attackerColour == 'w' else -1
+    for j, d in enumerate(KING_DIRECTIONS):
+        for i in range(1, 8):
+            endRow = r + d[0] * i
+            endCol = c + d[1] * i
+            if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                break
+            endPiece = board[endRow][endCol]
+            if endPiece == '--':
+                continue
+            if endPiece[0] == attackerColour:
+                pieceType = endPiece[1]
+                if pieceType == 'Q' or (j < 4 and pieceType == 'R') or (j >= 4 and pieceType == 'B') or \
+                        (i == 1 and (pieceType == 'K' or (pieceType == 'p' and j >= 4 and d[0] == pawnRow))):
+                    attackers.append((endRow, endCol))
+            break  # any piece blocks the rest of the ray
+    for d in KNIGHT_DIRECTIONS:
+        endRow = r + d[0]
+        endCol = c + d[1]
+        if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == attackerColour + 'N':
+            attackers.append((endRow, endCol))
+    return attackers
+
+
 # class which will be responsible for storing the foundation of a standard chess board
 # will be responsible for determining if it is a black or white move
 class GameState():
     # constructor function
-    def __init__(self):
+    # the game starts from the standard initial position unless the FEN string of another one is given
+    def __init__(self, fen=None):
         # string representation of the 8x8 chess board as a 2-dimesnional array
         # 1 element = 2 characters --> colour('w' or 'b') and piece('K', 'Q', 'R', 'B', 'N', 'P')
         # '--' = an empty space on the board --> no piece
@@ -37,11 +111,26 @@ class GameState():
         self.stalemate = False
         # coordinates for the square where en-passant capture is possible
         self.enPassantPossible = ()
-        self.enPassantPossibleLog = [self.enPassantPossible]
-        # setting all parameters of CastleRights class to True at the beginning of a game
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        # ally pieces pinned to the king while legal moves are generated --> {(row, col): direction of the pin}
+        self.pins = {}
+        # all four castling rights are available at the beginning of a game
+        self.currentCastlingRight = ALL_CASTLING_RIGHTS
+        # Zobrist key of the current position
+        self.zobristKey = self.computeZobristKey()
+        # state from before each move in moveLog --> see UNDO_ENTRY_SIZE
+        self.undoStack = [None] * (UNDO_STACK_SIZE * UNDO_ENTRY_SIZE)
+        self.undoCount = 0
+        # running evaluation totals, only kept once setEvaluation has been given the piece values
+        # materialValues[piece] and positionValues[piece][row*8 + col] are positive for white, negative for black
+        self.materialValues = None
+        self.positionValues = None
+        self.materialScore = 0
+        self.positionScore = 0
+        # plies since the last capture or pawn move (for the fifty-move rule) and the FEN move number
+        self.halfmoveClock = 0
+        self.fullmoveNumber = 1
+        if fen is not None:
+            self.loadFen(fen)
 
 
         #self.protects = [][]
@@ -53,6 +142,35 @@ class GameState():
 
         '''Takes a move as a paraemter and executes it'''
 
+        # saving everything the move changes which cannot be worked out from the move itself
+        i = self.undoCount * UNDO_ENTRY_SIZE
+        undoStack = self.undoStack
+        if i == len(undoStack):
+            undoStack.extend([None] * len(undoStack))
+        undoStack[i] = self.currentCastlingRight
+        undoStack[i + 1] = self.enPassantPossible
+        undoStack[i + 2] = self.zobristKey
+        undoStack[i + 3] = self.materialScore
+        undoStack[i + 4] = self.positionScore
+        undoStack[i + 5] = self.halfmoveClock
+        self.undoCount += 1
+        if move.pieceMoved[1] == 'p' or move.pieceCaptured != '--':
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
+
+        # the old castling rights and en passant file are removed from the key, the new ones added at the end
+        key = self.zobristKey ^ ZOBRIST_CASTLING[self.currentCastlingRight] ^ ZOBRIST_BLACK_TO_MOVE
+        if self.enPassantPossible:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossible[1]]
+        key ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow * 8 + move.startCol]
+        if move.isEnpassantMove:
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        elif move.pieceCaptured != '--':
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.endRow * 8 + move.endCol]
+
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move)
@@ -88,14 +206,29 @@ class GameState():
             else: # queenside castle
                 self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2] # moves the rook
                 self.board[move.endRow][move.endCol-2] = '--' # erase the old rook
-        
 
-        self.enPassantPossibleLog.append(self.enPassantPossible)
-        
+
         # updating castling rights - whenever it is a king or rook move
         self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+
+        # the piece which lands may be a promoted queen
+        key ^= ZOBRIST_PIECES[self.board[move.endRow][move.endCol]][move.endRow * 8 + move.endCol]
+        if move.isCastleMove:
+            rook = move.pieceMoved[0] + 'R'
+            if move.endCol - move.startCol == 2:  # kingside
+                key ^= ZOBRIST_PIECES[rook][move.endRow * 8 + 7] ^ ZOBRIST_PIECES[rook][move.endRow * 8 + 5]
+            else:  # queenside
+                key ^= ZOBRIST_PIECES[rook][move.endRow * 8] ^ ZOBRIST_PIECES[rook][move.endRow * 8 + 3]
+        key ^= ZOBRIST_CASTLING[self.currentCastlingRight]
+        if self.enPassantPossible:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossible[1]]
+        self.zobristKey = key
+        if self.materialValues is not None:
+            materialDelta, positionDelta = self.evaluationDelta(move)
+            self.materialScore += materialDelta
+            self.positionScore += positionDelta
+        if ZOBRIST_DEBUG:
+            assert self.zobristKey == self.computeZobristKey(), "incremental Zobrist key differs from a full recompute"
 
 
 
@@ -121,14 +254,18 @@ class GameState():
             if move.isEnpassantMove:
                 self.board[move.endRow][move.endCol] = '--' # leave landing square blank
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-            # update en passant log
-            self.enPassantPossibleLog.pop()
-            self.enPassantPossible = self.enPassantPossibleLog[-1]
-
-            # undo castling rights
-            self.castleRightsLog.pop() # get rid of new castle rights from move being undone
-            castle_rights = copy.deepcopy(self.castleRightsLog[-1])
-            self.currentCastlingRight = castle_rights # set current castle rights to the last one in the list
+            # restore castling rights, en passant square, key, evaluation totals and halfmove clock from before the move
+            self.undoCount -= 1
+            i = self.undoCount * UNDO_ENTRY_SIZE
+            undoStack = self.undoStack
+            self.currentCastlingRight = undoStack[i]
+            self.enPassantPossible = undoStack[i + 1]
+            self.zobristKey = undoStack[i + 2]
+            self.materialScore = undoStack[i + 3]
+            self.positionScore = undoStack[i + 4]
+            self.halfmoveClock = undoStack[i + 5]
+            if not self.whiteToMove:
+                self.fullmoveNumber -= 1
             # undo castle move
             if move.isCastleMove:
                 if move.endCol - move.startCol == 2: # kingside
@@ -141,46 +278,270 @@ class GameState():
             self.checkmate = False
             self.stalemate = False
 
-    # all moves where the King is in check i.e. checkmate moves
+    def keyHistory(self):
+        '''Zobrist keys of the positions before each move in moveLog, oldest first'''
+        return self.undoStack[2:self.undoCount * UNDO_ENTRY_SIZE:UNDO_ENTRY_SIZE]
+
+    def loadFen(self, fen):
+        '''Sets up the position given by a FEN string, starting a new move log from it'''
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least the board, side to move, castling and en passant fields: " + fen)
+        ranks = fields[0].split('/')
+        board = []
+        for rank in ranks:
+            row = []
+            for char in rank:
+                squares = FEN_SQUARES.get(char)
+                if squares is None:
+                    raise ValueError("unknown character '%s' in FEN: %s" % (char, fen))
+                row += squares
+            if len(row) != 8:
+                raise ValueError("FEN rank '%s' does not have 8 squares: %s" % (rank, fen))
+            board.append(row)
+        if len(board) != 8:
+            raise ValueError("FEN board does not have 8 ranks: " + fen)
+        whiteKingLocation = blackKingLocation = None
+        for r, row in enumerate(board):
+            if 'wK' in row:
+                whiteKingLocation = (r, row.index('wK'))
+            if 'bK' in row:
+                blackKingLocation = (r, row.index('bK'))
+        if whiteKingLocation is None or blackKingLocation is None:
+            raise ValueError("FEN position needs a king of each colour: " + fen)
+        if fields[1] not in ('w', 'b'):
+            raise ValueError("FEN side to move must be 'w' or 'b', not '%s': %s" % (fields[1], fen))
+        castlingRight = 0
+        if fields[2] != '-':
+            for char in fields[2]:
+                if char not in FEN_CASTLING:
+                    raise ValueError("unknown castling right '%s' in FEN: %s" % (char, fen))
+                castlingRight |= FEN_CASTLING[char]
+        if fields[3] == '-':
+            enPassantPossible = ()
+        else:
+            # the square a pawn has just passed over --> rank 6 after a black double step, rank 3 after a white one
+            epRank = '6' if fields[1] == 'w' else '3'
+            if len(fields[3]) != 2 or fields[3][0] not in 'abcdefgh' or fields[3][1] != epRank:
+                raise ValueError("FEN en passant square '%s' is not a file a-h on rank %s: %s" % (fields[3], epRank, fen))
+            enPassantPossible = (8 - int(fields[3][1]), ord(fields[3][0]) - ord('a'))
+        counters = fields[4:6]
+        for counter in counters:
+            if not counter.isdigit():
+                raise ValueError("FEN move counters must be whole numbers, not '%s': %s" % (counter, fen))
+
+        self.board = board
+        self.whiteKingLocation = whiteKingLocation
+        self.blackKingLocation = blackKingLocation
+        self.whiteToMove = fields[1] == 'w'
+        self.currentCastlingRight = castlingRight
+        self.enPassantPossible = enPassantPossible
+        self.halfmoveClock = int(counters[0]) if len(counters) > 0 else 0
+        self.fullmoveNumber = int(counters[1]) if len(counters) > 1 else 1
+        self.moveLog = []
+        self.undoCount = 0
+        self.pins = {}
+        self.checkmate = False
+        self.stalemate = False
+        self.zobristKey = self.computeZobristKey()
+        if self.materialValues is not None:
+            self.materialScore, self.positionScore = self.computeEvaluation()
+
+    def getFen(self):
+        '''The FEN string of the current position'''
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for square in row:
+                if square == '--':
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += FEN_PIECES[square]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        castling = ''.join(char for char, right in FEN_CASTLING.items() if self.currentCastlingRight & right) or '-'
+        if self.enPassantPossible:
+            r, c = self.enPassantPossible
+            enPassant = 'abcdefgh'[c] + str(8 - r)
+        else:
+            enPassant = '-'
+        return '%s %s %s %s %d %d' % ('/'.join(ranks), 'w' if self.whiteToMove else 'b', castling, enPassant,
+                                      self.halfmoveClock, self.fullmoveNumber)
+
+    def computeZobristKey(self):
+        '''Computes the Zobrist key of the current position from scratch'''
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                square = self.board[r][c]
+                if square != '--':
+                    key ^= ZOBRIST_PIECES[square][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.currentCastlingRight]
+        if self.enPassantPossible:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossible[1]]
+        return key
+
+    def setEvaluation(self, materialValues, positionValues):
+        '''Starts keeping running material and piece-square totals using the given values'''
+        self.materialValues = materialValues
+        self.positionValues = positionValues
+        self.materialScore, self.positionScore = self.computeEvaluation()
+
+    def computeEvaluation(self):
+        '''Computes the material and piece-square totals of the current position from scratch'''
+        materialScore = 0
+        positionScore = 0
+        for r in range(8):
+            for c in range(8):
+                square = self.board[r][c]
+                if square != '--':
+                    materialScore += self.materialValues[square]
+                    positionScore += self.positionValues[square][r * 8 + c]
+        return materialScore, positionScore
+
+    def evaluationDelta(self, move):
+        '''The change in the material and piece-square totals caused by making the move'''
+        positionValues = self.positionValues
+        pieceLanded = move.pieceMoved[0] + 'Q' if move.isPawnPromotion else move.pieceMoved
+        materialDelta = self.materialValues[pieceLanded] - self.materialValues[move.pieceMoved]
+        positionDelta = positionValues[pieceLanded][move.endRow * 8 + move.endCol] - \
+                        positionValues[move.pieceMoved][move.startRow * 8 + move.startCol]
+        if move.pieceCaptured != '--':
+            capturedRow = move.startRow if move.isEnpassantMove else move.endRow
+            materialDelta -= self.materialValues[move.pieceCaptured]
+            positionDelta -= positionValues[move.pieceCaptured][capturedRow * 8 + move.endCol]
+        if move.isCastleMove:
+            rookValues = positionValues[move.pieceMoved[0] + 'R']
+            if move.endCol - move.startCol == 2:  # kingside
+                positionDelta += rookValues[move.endRow * 8 + 5] - rookValues[move.endRow * 8 + 7]
+            else:  # queenside
+                positionDelta += rookValues[move.endRow * 8 + 3] - rookValues[move.endRow * 8]
+        return materialDelta, positionDelta
+
+    # all legal moves for the side to move
     def getValidMoves(self):  # getValidMoves in tutorial
-        # NÄIVE ALGORITHM IMPLEMENTATION --> favours simplicity over efficency
-        # inefficent because it generates all possible opponent moves for every move
-        tempEnPassantPossible = self.enPassantPossible
-        tempCastleRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                        self.currentCastlingRight.wqs, self.currentCastlingRight.bqs) # copy current castling rights
-        # 1. generate all possible moves
+        # pins and checks are found once per position by looking outwards from the king
+        # so only legal moves are kept, without making every move and regenerating the opponent's replies
+        if self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        self.pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        # the move functions skip any direction a pinned piece cannot move in
         moves = self.allPossibleMoves()
-        # 2. make move
-        for i in range(len(moves)-1, -1, -1): # iterating through the for loop backwards by -1 with range(len(moves)-1, -1)
-            self.makeMove(moves[i])
-            # 3. generate all opponent moves
-            # 4. look for opponent moves that attack king
-            # makeMove function swaps turns, so the turns must be swapped again before calling inCheck()
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                # 5. if king is not safe --> invalid move
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
-        if len(moves) == 0: # either checkmate or stalemate if there are no valid moves remaining
-            if self.inCheck():
+        self.pins = {}
+
+        if len(checks) == 1:
+            # block the check, capture the checking piece or move the king
+            checkRow, checkCol, dr, dc = checks[0]
+            if self.board[checkRow][checkCol][1] == 'N':
+                validSquares = {(checkRow, checkCol)}  # a knight check cannot be blocked
+            else:
+                validSquares = set()
+                for i in range(1, 8):
+                    validSquare = (kingRow + dr * i, kingCol + dc * i)
+                    validSquares.add(validSquare)
+                    if validSquare == (checkRow, checkCol):  # stop once the checking piece is reached
+                        break
+            moves = [move for move in moves if move.pieceMoved[1] == 'K' or move.isEnpassantMove
+                     or (move.endRow, move.endCol) in validSquares]
+        elif len(checks) > 1:
+            # double check --> only the king can move
+            moves = [move for move in moves if move.pieceMoved[1] == 'K']
+
+        validMoves = []
+        for move in moves:
+            if move.pieceMoved[1] == 'K':
+                if not self.kingAttackedAt(move.endRow, move.endCol):
+                    validMoves.append(move)
+            elif move.isEnpassantMove:
+                # en passant removes two pawns from the same rank, so it is checked by playing it out
+                if self.enpassantIsLegal(move, kingRow, kingCol):
+                    validMoves.append(move)
+            else:
+                validMoves.append(move)
+
+        # calling castle moves functions
+        if len(checks) == 0:
+            self.getCastleMoves(kingRow, kingCol, validMoves)
+
+        if len(validMoves) == 0: # either checkmate or stalemate if there are no valid moves remaining
+            if len(checks) > 0:
                 self.checkmate = True
             else:
                 self.stalemate = True
         else:
             self.checkmate = False
             self.stalemate = False
-        
-        # calling castle moves functions
+        return validMoves
+
+    def checkForPinsAndChecks(self, r, c):
+        '''Looks outwards from square (r,c) for enemy pieces giving check and ally pieces pinned to it'''
+        # pins = {(row, col): direction of the pin from the king}
+        # checks = [(row, col, dr, dc)] for each enemy piece attacking the square
+        pins = {}
+        checks = []
         if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
+            allyColour, enemyColour, pawnRow = 'w', 'b', -1
         else:
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
+            allyColour, enemyColour, pawnRow = 'b', 'w', 1
+        for j, d in enumerate(KING_DIRECTIONS):
+            possiblePin = ()
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                endPiece = self.board[endRow][endCol]
+                # the ally king is treated as empty so squares along its own line of attack stay attacked
+                if endPiece[0] == allyColour and endPiece[1] != 'K':
+                    if possiblePin == ():  # first ally piece could be pinned
+                        possiblePin = (endRow, endCol)
+                    else:  # second ally piece --> no pin or check in this direction
+                        break
+                elif endPiece[0] == enemyColour:
+                    pieceType = endPiece[1]
+                    # 1. orthogonally away from the square and the piece is a rook
+                    # 2. diagonally away from the square and the piece is a bishop
+                    # 3. one square away diagonally and the piece is a pawn attacking towards the square
+                    # 4. any direction and the piece is a queen
+                    # 5. one square away in any direction and the piece is a king
+                    if (j < 4 and pieceType == 'R') or (j >= 4 and pieceType == 'B') or \
+                            (i == 1 and pieceType == 'p' and j >= 4 and d[0] == pawnRow) or \
+                            pieceType == 'Q' or (i == 1 and pieceType == 'K'):
+                        if possiblePin == ():  # no piece blocking --> check
+                            checks.append((endRow, endCol, d[0], d[1]))
+                        else:  # ally piece blocking --> pin
+                            pins[possiblePin] = d
+                    break
+        for d in KNIGHT_DIRECTIONS:
+            endRow = r + d[0]
+            endCol = c + d[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and self.board[endRow][endCol] == enemyColour + 'N':
+                checks.append((endRow, endCol, d[0], d[1]))
+        return pins, checks
 
-        self.enPassantPossible = tempEnPassantPossible
-        self.currentCastlingRight = tempCastleRights
-        return moves
+    # determines if the king of the side to move would be attacked on square (r,c)
+    def kingAttackedAt(self, r, c):
+        return len(self.checkForPinsAndChecks(r, c)[1]) > 0
 
+    def enpassantIsLegal(self, move, kingRow, kingCol):
+        capturedRow, capturedCol = move.startRow, move.endCol
+        self.board[move.startRow][move.startCol] = '--'
+        self.board[capturedRow][capturedCol] = '--'
+        self.board[move.endRow][move.endCol] = move.pieceMoved
+        legal = not self.kingAttackedAt(kingRow, kingCol)
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        self.board[capturedRow][capturedCol] = move.pieceCaptured
+        self.board[move.endRow][move.endCol] = '--'
+        return legal
 
     # determines if current player is in check
     def inCheck(self):
@@ -191,13 +552,11 @@ class GameState():
 
     # determines if the enemy can attack square (r,c)
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove # switches to an opponent's view of the board
-        oppMoves = self.allPossibleMoves()
-        self.whiteToMove = not self.whiteToMove # switch turns
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c: # shows that the second square clicked is under attack
-                return True
-        return False
+        return len(self.getAttackers(r, c)) > 0
+
+    def getAttackers(self, r, c):
+        '''Returns the (row, col) of every enemy piece attacking square (r,c)'''
+        return squareAttackers(self.board, r, c, 'b' if self.whiteToMove else 'w')
 
 
     # all possible moves (not considering check)
@@ -216,6 +575,13 @@ class GameState():
                     self.moveFunctions[piece](r, c, moves)
         return moves
 
+    # determines if the piece at (r,c) is pinned and so cannot move in direction d
+    def pinnedAgainst(self, r, c, d):
+        pinDirection = self.pins.get((r, c))
+        if pinDirection is None:
+            return False
+        return d != pinDirection and d != (-pinDirection[0], -pinDirection[1])
+
     # get all possible pawn moves for the pawn at [row][col]
     # add to list
     def getPawnMoves(self, r, c, moves):
@@ -228,34 +594,34 @@ class GameState():
             # check if 2 spaces in front of you is clear
             # check which row pawn is in
             # append moves to list accordingly
-            if self.board[r-1][c] == "--":  # one square advancement --> white
+            if self.board[r-1][c] == "--" and not self.pinnedAgainst(r, c, (-1, 0)):  # one square advancement --> white
                 moves.append(Move((r, c), (r-1, c), self.board))
                 # checks if two spaces ahead is clear only if one ahead is clear
                 if r == 6 and self.board[r-2][c] == "--":
                     moves.append(Move((r, c), (r-2, c), self.board))
-            if (c-1) >= 0:  # avoids pawn from going off the left of the board
+            if (c-1) >= 0 and not self.pinnedAgainst(r, c, (-1, -1)):  # avoids pawn from going off the left of the board
                 if self.board[r-1][c-1][0] == 'b':  # enemy piece to capture on left
                     moves.append(Move((r, c), (r-1, c-1), self.board))
                 elif (r-1, c-1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r-1, c-1), self.board, isEnpassantMove=True))
-            if (c+1) <= 7:
+            if (c+1) <= 7 and not self.pinnedAgainst(r, c, (-1, 1)):
                 if self.board[r-1][c+1][0] == 'b':  # enemy piece to capture on the right
                     moves.append(Move((r, c), (r-1, c+1), self.board))
                 elif (r-1, c+1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r-1, c+1), self.board, isEnpassantMove=True))
 
         else:  # black pawn moves
-            if self.board[r+1][c] == "--":  # one square advancement --> black
+            if self.board[r+1][c] == "--" and not self.pinnedAgainst(r, c, (1, 0)):  # one square advancement --> black
                 moves.append(Move((r, c), (r+1, c), self.board))
                 if r == 1 and self.board[r+2][c] == "--":
                     # two square advancement --> black
                     moves.append(Move((r, c), (r+2, c), self.board))
-            if (c-1) >= 0:
+            if (c-1) >= 0 and not self.pinnedAgainst(r, c, (1, -1)):
                 if self.board[r+1][c-1][0] == 'w':
                     moves.append(Move((r, c), (r+1, c-1), self.board))
                 elif (r+1, c-1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r+1, c-1), self.board, isEnpassantMove=True))
-            if (c+1) <= 7:
+            if (c+1) <= 7 and not self.pinnedAgainst(r, c, (1, 1)):
                 if self.board[r+1][c+1][0] == 'w':
                     moves.append(Move((r, c), (r+1, c+1), self.board))
                 elif (r+1, c+1) == self.enPassantPossible:
@@ -276,6 +642,8 @@ class GameState():
         else:
             enemyColour = 'w'
         for d in directions:
+            if self.pinnedAgainst(r, c, d):
+                continue
             for i in range(1, 8):
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
@@ -298,6 +666,8 @@ class GameState():
         # knights can move in L shapes e.g. (one left, two up), (two left, one up)
         # they can capture a piece on the squares they can move to
         knightDirections = ((-2,-1), (-2,1), (-1, -2), (-1,2), (1,-2), (1,2), (2,-1), (2,1))# knightMoves in tutorial
+        if (r, c) in self.pins:
+            return # a pinned knight can never stay on the line of the pin
         allyColour = "w" if self.whiteToMove else "b"
         for k in knightDirections:
             endRow = r + k[0]
@@ -316,6 +686,8 @@ class GameState():
         directions = ((-1,-1), (-1,1), (1,-1), (1,1)) # diagonal directions
         enemyColour = "b" if self.whiteToMove else "w"
         for d in directions:
+            if self.pinnedAgainst(r, c, d):
+                continue
             for i in range(1, 8):
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
@@ -353,45 +725,45 @@ class GameState():
     def getCastleMoves(self, r, c, moves):
         if self.squareUnderAttack(r, c):
             return # cannot castle whilst in check
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (not self.whiteToMove and self.currentCastlingRight.bks):
+        if self.currentCastlingRight & (WHITE_KINGSIDE if self.whiteToMove else BLACK_KINGSIDE):
             self.getKingsideCastleMoves(r, c, moves)
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (not self.whiteToMove and self.currentCastlingRight.bqs):
+        if self.currentCastlingRight & (WHITE_QUEENSIDE if self.whiteToMove else BLACK_QUEENSIDE):
             self.getQueensideCastleMoves(r, c, moves)
 
         # update the castle rights given the move
     def updateCastleRights(self, move):
+        if self.currentCastlingRight == 0:
+            return
         if move.pieceMoved == 'wK':
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
+            self.currentCastlingRight &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
         elif move.pieceMoved == 'bK':
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
+            self.currentCastlingRight &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
         elif move.pieceMoved == 'wR':
             if move.startRow == 7:# white rook starts on row 7
                 if move.startCol == 0:# left rook
-                    self.currentCastlingRight.wqs = False
+                    self.currentCastlingRight &= ~WHITE_QUEENSIDE
                 elif move.startCol == 7:# right rook
-                    self.currentCastlingRight.wks = False
+                    self.currentCastlingRight &= ~WHITE_KINGSIDE
         elif move.pieceMoved == 'bR':
-            if move.startRow == 0:# white rook starts on row 7
+            if move.startRow == 0:# black rook starts on row 0
                 if move.startCol == 0:# left rook
-                    self.currentCastlingRight.bqs = False
+                    self.currentCastlingRight &= ~BLACK_QUEENSIDE
                 elif move.startCol == 7:# right rook
-                    self.currentCastlingRight.bks = False
+                    self.currentCastlingRight &= ~BLACK_KINGSIDE
         
         # if a rook is captured
         if move.pieceCaptured == 'wR':
             if move.endRow == 7:
                 if move.endCol == 0:
-                    self.currentCastlingRight.wqs = False
+                    self.currentCastlingRight &= ~WHITE_QUEENSIDE
                 elif move.endCol == 7:
-                    self.currentCastlingRight.wks = False
+                    self.currentCastlingRight &= ~WHITE_KINGSIDE
         elif move.pieceCaptured == 'bR':
             if move.endRow == 0:
                 if move.endCol == 0:
-                    self.currentCastlingRight.bqs = False
+                    self.currentCastlingRight &= ~BLACK_QUEENSIDE
                 elif move.endCol == 7:
-                    self.currentCastlingRight.bks = False
+                    self.currentCastlingRight &= ~BLACK_KINGSIDE
 
 
     def getKingsideCastleMoves(self, r, c, moves):
@@ -419,18 +791,6 @@ class GameState():
         self.getBishopMoves(r, c, moves)
 
 
-class CastleRights():
-    """Initializing white/black king side and white/black queen side castling right variables"""
-    def __init__(self, wks, bks, wqs, bqs):
-        """Constructor function for CastleRights class"""
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
-
-
-
-
 # class which will be responsible for checking if a move can be made
 class Move():
 
@@ -448,6 +808,11 @@ class Move():
                    "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
+    # a fixed set of attributes instead of a per-object __dict__ --> smaller and quicker to create
+    # notation is only worked out when getChessNotation or str() is called
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'isPawnPromotion',
+                 'isEnpassantMove', 'isCastleMove', 'isCapture', 'moveID')
+
     def __init__(self, startSquare, endSquare, board, isEnpassantMove=False, isCastleMove=False):
         self.startRow = startSquare[0]
         self.startCol = startSquare[1]
@@ -475,22 +840,32 @@ class Move():
         self.isCapture = self.pieceCaptured != '--'
     
         # moveID is similar to a hash function as each move will have a unique ID
-        self.moveID = self.startRow * 1000 + self.startCol * \
-            100 + self.endRow * 10 + self.endCol
-        # print(self.moveID)
-
-
+        # the start and end squares (row*8 + col) are packed into 12 bits --> startSquare*64 + endSquare
+        self.moveID = (self.startRow * 8 + self.startCol) << 6 | self.endRow * 8 + self.endCol
 
+    @staticmethod
+    def startOf(moveID):
+        """The (row, col) a packed moveID starts from"""
+        return divmod(moveID >> 6, 8)
 
+    @staticmethod
+    def endOf(moveID):
+        """The (row, col) a packed moveID ends on"""
+        return divmod(moveID & 63, 8)
 
-        """
-        Overriding equals method
-        """
+    # Overriding equals method
     def __eq__(self, other):
         if isinstance(other, Move):  # makes sure if the other object is an instance of the Move class
             # if same piece, same startRow, startCol, endRow, endCol
             return self.moveID == other.moveID
         return False  # if they are not equal
+
+    # equal moves have equal hashes, so moves can be used in sets and as dictionary keys
+    def __hash__(self):
+        return self.moveID
+
+    def __repr__(self):
+        return "Move(" + self.getChessNotation() + ")"
     
     # function which uses the dictionaries to convert array indices into ranks/files for a selected square
     def getRankFile(self, r, c):
@@ -529,4 +904,403 @@ class Move():
         moveString = self.pieceMoved[1]
         if self.isCapture:
             moveString += 'x'
-        return moveString + endSquare
\ No newline at end of file
+        return moveString + endSquare
+
+
+# ---------------------------------------------------------------------------------------------
+# Bitboard backend
+# ---------------------------------------------------------------------------------------------
+# The position is also stored as 64-bit integers, one per piece type and colour, plus one
+# occupancy board per colour. Square (r, c) is bit r*8 + c, so a8 is bit 0 and h1 is bit 63.
+# Moves are generated with set operations on these integers instead of walking the 8x8 list.
+
+def _buildStepAttacks(steps):
+    # attack table for pieces which jump a fixed offset (knights, kings)
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in steps:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                attacks |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(attacks)
+    return table
+
+
+def _buildRays():
+    # RAYS[d][sq] = every square from sq (exclusive) to the edge of the board in direction d
+    rays = {}
+    for d in KING_DIRECTIONS:
+        table = []
+        for sq in range(64):
+            r, c = divmod(sq, 8)
+            ray = 0
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                ray |= 1 << (endRow * 8 + endCol)
+            table.append(ray)
+        rays[d] = table
+    return rays
+
+
+# directions which move towards higher bit indices - their first blocker is the lowest set bit
+POSITIVE_DIRECTIONS = ((1, 0), (0, 1), (1, -1), (1, 1))
+
+KNIGHT_ATTACKS = _buildStepAttacks(KNIGHT_DIRECTIONS)
+KING_ATTACKS = _buildStepAttacks(KING_DIRECTIONS)
+# squares attacked by a pawn of the given colour standing on sq
+PAWN_ATTACKS = {'w': _buildStepAttacks(((-1, -1), (-1, 1))), 'b': _buildStepAttacks(((1, -1), (1, 1)))}
+RAYS = _buildRays()
+FULL_BOARD = (1 << 64) - 1
+FILE_A = sum(1 << (r * 8) for r in range(8))
+FILE_H = FILE_A << 7
+# the rows a pawn reaches with one step from its starting row --> a second step is allowed from these
+WHITE_SINGLE_STEP_ROW = 0xFF << 40
+BLACK_SINGLE_STEP_ROW = 0xFF << 16
+# (row, col) of each square, so that building a Move does not need a divmod
+SQUARE_COORDINATES = [divmod(sq, 8) for sq in range(64)]
+
+
+def slidingAttacks(sq, occupied, directions):
+    """Squares a slider on sq attacks along the given directions, stopping at the first blocker"""
+    attacks = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= RAYS[d][firstBlocker(d, blockers)]
+        attacks |= ray
+    return attacks
+
+
+def _buildRelevantMasks(directions):
+    # the squares of each ray whose occupancy can change a slider's attacks --> all but the one on the edge,
+    # which is attacked whether or not anything stands on it
+    masks = []
+    for sq in range(64):
+        mask = 0
+        for d in directions:
+            ray = RAYS[d][sq]
+            if ray:
+                edge = ray.bit_length() - 1 if d in POSITIVE_DIRECTIONS else (ray & -ray).bit_length() - 1
+                mask |= ray ^ (1 << edge)
+        masks.append(mask)
+    return masks
+
+
+# Slider attacks only depend on the occupancy of the relevant squares, so each one is worked out once
+# and then looked up by square and relevant occupancy. The tables fill in as positions are met, up to
+# 4096 entries for a rook square and 512 for a bishop square.
+ROOK_MASKS = _buildRelevantMasks(ROOK_DIRECTIONS)
+BISHOP_MASKS = _buildRelevantMasks(BISHOP_DIRECTIONS)
+ROOK_TABLES = [{} for sq in range(64)]
+BISHOP_TABLES = [{} for sq in range(64)]
+
+
+def rookAttacks(sq, occupied):
+    occupied &= ROOK_MASKS[sq]
+    attacks = ROOK_TABLES[sq].get(occupied)
+    if attacks is None:
+        attacks = ROOK_TABLES[sq][occupied] = slidingAttacks(sq, occupied, ROOK_DIRECTIONS)
+    return attacks
+
+
+def bishopAttacks(sq, occupied):
+    occupied &= BISHOP_MASKS[sq]
+    attacks = BISHOP_TABLES[sq].get(occupied)
+    if attacks is None:
+        attacks = BISHOP_TABLES[sq][occupied] = slidingAttacks(sq, occupied, BISHOP_DIRECTIONS)
+    return attacks
+
+
+def firstBlocker(d, blockers):
+    """Index of the blocker nearest the start of a ray in direction d, or -1 if there is none"""
+    if not blockers:
+        return -1
+    if d in POSITIVE_DIRECTIONS:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+
+def directionBetween(fromSq, toSq):
+    """Direction of toSq from fromSq, which must share a rank, file or diagonal"""
+    dr = (toSq // 8 > fromSq // 8) - (toSq // 8 < fromSq // 8)
+    dc = (toSq % 8 > fromSq % 8) - (toSq % 8 < fromSq % 8)
+    return (dr, dc)
+
+
+def iterSquares(bitboard):
+    """Yields the index of every set bit in the bitboard, lowest first"""
+    while bitboard:
+        lsb = bitboard & -bitboard
+        yield lsb.bit_length() - 1
+        bitboard ^= lsb
+
+
+# class which keeps the same interface as GameState but generates moves from bitboards
+# Move generation and attack tests only read the bitboards. The 8x8 board list is still kept as the
+# square --> piece lookup which Move, the evaluation and ChessMain read, and each move is XORed into
+# the bitboards straight from the Move.
+class BitboardGameState(GameState):
+    def __init__(self, fen=None):
+        super().__init__(fen)
+        self.pieceBitboards = {}
+        self.colourBitboards = {}
+        self.setBitboardsFromBoard()
+
+    def loadFen(self, fen):
+        super().loadFen(fen)
+        self.setBitboardsFromBoard()
+
+    def setBitboardsFromBoard(self):
+        '''Rebuilds every bitboard from the 8x8 board list'''
+        self.pieceBitboards = {colour + piece: 0 for colour in 'wb' for piece in 'pRNBQK'}
+        self.colourBitboards = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                square = self.board[r][c]
+                if square != '--':
+                    bit = 1 << (r * 8 + c)
+                    self.pieceBitboards[square] |= bit
+                    self.colourBitboards[square[0]] |= bit
+
+    def makeMove(self, move):
+        super().makeMove(move)
+        self.toggleMove(move, self.board[move.endRow][move.endCol])
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            self.toggleMove(move, self.board[move.endRow][move.endCol])
+            super().undoMove()
+
+    def toggleMove(self, move, landed):
+        # XORs a move into the bitboards, so the same call makes the move and takes it back
+        # landed is the piece on the end square after the move --> a queen rather than the pawn for a promotion
+        pieceBitboards = self.pieceBitboards
+        colourBitboards = self.colourBitboards
+        colour = move.pieceMoved[0]
+        startBit = 1 << (move.startRow * 8 + move.startCol)
+        endBit = 1 << (move.endRow * 8 + move.endCol)
+        pieceBitboards[move.pieceMoved] ^= startBit
+        pieceBitboards[landed] ^= endBit
+        colourBitboards[colour] ^= startBit | endBit
+        if move.isCapture:
+            capturedBit = 1 << (move.startRow * 8 + move.endCol) if move.isEnpassantMove else endBit
+            pieceBitboards[move.pieceCaptured] ^= capturedBit
+            colourBitboards['b' if colour == 'w' else 'w'] ^= capturedBit
+        elif move.isCastleMove:
+            rowStart = move.endRow * 8
+            if move.endCol - move.startCol == 2:  # kingside
+                rookBits = (1 << (rowStart + 7)) | (1 << (rowStart + 5))
+            else:  # queenside
+                rookBits = (1 << rowStart) | (1 << (rowStart + 3))
+            pieceBitboards[colour + 'R'] ^= rookBits
+            colourBitboards[colour] ^= rookBits
+
+    # determines if the enemy can attack square (r,c) by looking outwards from the square
+    def squareUnderAttack(self, r, c):
+        sq = r * 8 + c
+        allyColour, enemyColour = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        bitboards = self.pieceBitboards
+        if KNIGHT_ATTACKS[sq] & bitboards[enemyColour + 'N']:
+            return True
+        if KING_ATTACKS[sq] & bitboards[enemyColour + 'K']:
+            return True
+        # an enemy pawn attacks sq if an ally pawn on sq would attack the enemy pawn
+        if PAWN_ATTACKS[allyColour][sq] & bitboards[enemyColour + 'p']:
+            return True
+        occupied = self.colourBitboards['w'] | self.colourBitboards['b']
+        queens = bitboards[enemyColour + 'Q']
+        if rookAttacks(sq, occupied) & (bitboards[enemyColour + 'R'] | queens):
+            return True
+        if bishopAttacks(sq, occupied) & (bitboards[enemyColour + 'B'] | queens):
+            return True
+        return False
+
+    def getAttackers(self, r, c):
+        '''Returns the (row, col) of every enemy piece attacking square (r,c)'''
+        occupied = self.colourBitboards['w'] | self.colourBitboards['b']
+        attackers = self.attackersTo(r * 8 + c, occupied, 'b' if self.whiteToMove else 'w')
+        return [SQUARE_COORDINATES[sq] for sq in iterSquares(attackers)]
+
+    def attackersTo(self, sq, occupied, colour):
+        '''Bitboard of the pieces of the given colour which attack sq when the board has the given occupancy'''
+        bitboards = self.pieceBitboards
+        queens = bitboards[colour + 'Q']
+        return (KNIGHT_ATTACKS[sq] & bitboards[colour + 'N']) | \
+               (KING_ATTACKS[sq] & bitboards[colour + 'K']) | \
+               (PAWN_ATTACKS['b' if colour == 'w' else 'w'][sq] & bitboards[colour + 'p']) | \
+               (rookAttacks(sq, occupied) & (bitboards[colour + 'R'] | queens)) | \
+               (bishopAttacks(sq, occupied) & (bitboards[colour + 'B'] | queens))
+
+    # all legal moves for the side to move
+    def getValidMoves(self):
+        allyColour, enemyColour = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        bitboards = self.pieceBitboards
+        allies = self.colourBitboards[allyColour]
+        occupied = allies | self.colourBitboards[enemyColour]
+        kingBit = bitboards[allyColour + 'K']
+        kingSq = kingBit.bit_length() - 1
+        checkers = self.attackersTo(kingSq, occupied, enemyColour)
+        pinRays = self.getPinRays(kingSq, allyColour, enemyColour, occupied)
+
+        # checkMask = squares a piece other than the king may move to
+        if checkers == 0:
+            checkMask = FULL_BOARD
+        elif checkers & (checkers - 1):  # double check --> only the king can move
+            checkMask = 0
+        else:  # capture the checking piece or block the line between it and the king
+            checkerSq = checkers.bit_length() - 1
+            checkMask = checkers
+            if checkers & (bitboards[enemyColour + 'R'] | bitboards[enemyColour + 'B'] | bitboards[enemyColour + 'Q']):
+                d = directionBetween(kingSq, checkerSq)
+                checkMask |= RAYS[d][kingSq] ^ RAYS[d][checkerSq]
+
+        moves = []
+        if checkMask:
+            self.generateMoves(allyColour, checkMask, pinRays, moves)
+            self.getEnpassantBitboardMoves(allyColour, enemyColour, kingSq, occupied, moves)
+
+        # the king is taken off the board so that it cannot hide behind itself along a checking line
+        occupiedWithoutKing = occupied ^ kingBit
+        kingSquare = SQUARE_COORDINATES[kingSq]
+        for target in iterSquares(KING_ATTACKS[kingSq] & ~allies):
+            if not self.attackersTo(target, occupiedWithoutKing, enemyColour):
+                moves.append(Move(kingSquare, SQUARE_COORDINATES[target], self.board))
+
+        if checkers == 0:
+            self.getCastleMoves(kingSquare[0], kingSquare[1], moves)
+
+        if len(moves) == 0:  # either checkmate or stalemate if there are no valid moves remaining
+            if checkers:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    def getPinRays(self, kingSq, allyColour, enemyColour, occupied):
+        '''Finds ally pieces pinned to the king --> {square: squares it may still move to}'''
+        bitboards = self.pieceBitboards
+        allies = self.colourBitboards[allyColour]
+        queens = bitboards[enemyColour + 'Q']
+        rookSliders = bitboards[enemyColour + 'R'] | queens
+        bishopSliders = bitboards[enemyColour + 'B'] | queens
+        pinRays = {}
+        for d in KING_DIRECTIONS:
+            sliders = rookSliders if d in ROOK_DIRECTIONS else bishopSliders
+            if not RAYS[d][kingSq] & sliders:
+                continue
+            first = firstBlocker(d, RAYS[d][kingSq] & occupied)
+            if first < 0 or not (1 << first) & allies:
+                continue
+            second = firstBlocker(d, RAYS[d][first] & occupied)
+            if second >= 0 and (1 << second) & sliders:
+                # the pinned piece can move anywhere between the king and the pinning piece, including capturing it
+                pinRays[first] = RAYS[d][kingSq] ^ RAYS[d][second]
+        return pinRays
+
+    # all possible moves (not considering check)
+    def allPossibleMoves(self):
+        moves = []
+        allyColour = 'w' if self.whiteToMove else 'b'
+        self.generateMoves(allyColour, FULL_BOARD, {}, moves)
+        if self.enPassantPossible:
+            epSq = self.enPassantPossible[0] * 8 + self.enPassantPossible[1]
+            for sq in iterSquares(PAWN_ATTACKS['b' if allyColour == 'w' else 'w'][epSq] & self.pieceBitboards[allyColour + 'p']):
+                moves.append(Move(SQUARE_COORDINATES[sq], self.enPassantPossible, self.board, isEnpassantMove=True))
+        for sq in iterSquares(self.pieceBitboards[allyColour + 'K']):
+            self.addMoves(sq, KING_ATTACKS[sq] & ~self.colourBitboards[allyColour], moves)
+        return moves
+
+    def generateMoves(self, allyColour, targetMask, pinRays, moves):
+        # moves for every piece except the king and en passant captures
+        # targetMask limits where pieces may land, pinRays limits each pinned piece to its line
+        enemyColour = 'b' if allyColour == 'w' else 'w'
+        bitboards = self.pieceBitboards
+        allies = self.colourBitboards[allyColour]
+        enemies = self.colourBitboards[enemyColour]
+        occupied = allies | enemies
+        targets = ~allies & targetMask
+        self.getPawnBitboardMoves(allyColour, enemies, occupied, targetMask, pinRays, moves)
+        for sq in iterSquares(bitboards[allyColour + 'N']):
+            if sq not in pinRays:  # a pinned knight can never stay on the line of the pin
+                self.addMoves(sq, KNIGHT_ATTACKS[sq] & targets, moves)
+        for sq in iterSquares(bitboards[allyColour + 'B'] | bitboards[allyColour + 'Q']):
+            self.addMoves(sq, bishopAttacks(sq, occupied) & targets & pinRays.get(sq, FULL_BOARD), moves)
+        for sq in iterSquares(bitboards[allyColour + 'R'] | bitboards[allyColour + 'Q']):
+            self.addMoves(sq, rookAttacks(sq, occupied) & targets & pinRays.get(sq, FULL_BOARD), moves)
+
+    def addMoves(self, sq, targets, moves):
+        # one Move from sq to every set bit in targets
+        startSquare = SQUARE_COORDINATES[sq]
+        board = self.board
+        while targets:
+            bit = targets & -targets
+            moves.append(Move(startSquare, SQUARE_COORDINATES[bit.bit_length() - 1], board))
+            targets ^= bit
+
+    def addPawnMoves(self, targets, offset, moves):
+        # one Move to every set bit in targets, from the square offset away from it
+        board = self.board
+        while targets:
+            bit = targets & -targets
+            target = bit.bit_length() - 1
+            moves.append(Move(SQUARE_COORDINATES[target + offset], SQUARE_COORDINATES[target], board))
+            targets ^= bit
+
+    def getPawnBitboardMoves(self, allyColour, enemies, occupied, targetMask, pinRays, moves):
+        pawns = self.pieceBitboards[allyColour + 'p']
+        pinned = 0
+        for sq in pinRays:
+            pinned |= 1 << sq
+        free = pawns & ~pinned
+        empty = ~occupied & FULL_BOARD
+        # the pawns which are not pinned all move at once by shifting their bitboard one row forwards
+        if allyColour == 'w':
+            oneStep = (free >> 8) & empty
+            self.addPawnMoves(oneStep & targetMask, 8, moves)
+            self.addPawnMoves(((oneStep & WHITE_SINGLE_STEP_ROW) >> 8) & empty & targetMask, 16, moves)
+            self.addPawnMoves(((free & ~FILE_A) >> 9) & enemies & targetMask, 9, moves)
+            self.addPawnMoves(((free & ~FILE_H) >> 7) & enemies & targetMask, 7, moves)
+        else:
+            oneStep = (free << 8) & empty
+            self.addPawnMoves(oneStep & targetMask, -8, moves)
+            self.addPawnMoves(((oneStep & BLACK_SINGLE_STEP_ROW) << 8) & empty & targetMask, -16, moves)
+            self.addPawnMoves(((free & ~FILE_A) << 7) & enemies & targetMask, -7, moves)
+            self.addPawnMoves(((free & ~FILE_H) << 9) & enemies & targetMask, -9, moves)
+        if pawns & pinned:
+            self.getPinnedPawnMoves(allyColour, pawns & pinned, enemies, empty, targetMask, pinRays, moves)
+
+    def getPinnedPawnMoves(self, allyColour, pawns, enemies, empty, targetMask, pinRays, moves):
+        # a pinned pawn can only move along the line of its pin, so each one is generated on its own
+        forward, startRow = (-8, 6) if allyColour == 'w' else (8, 1)
+        for sq in iterSquares(pawns):
+            startSquare = SQUARE_COORDINATES[sq]
+            mask = targetMask & pinRays[sq]
+            oneStep = sq + forward
+            if (1 << oneStep) & empty:
+                if (1 << oneStep) & mask:
+                    moves.append(Move(startSquare, SQUARE_COORDINATES[oneStep], self.board))
+                twoStep = oneStep + forward
+                if startSquare[0] == startRow and (1 << twoStep) & empty & mask:
+                    moves.append(Move(startSquare, SQUARE_COORDINATES[twoStep], self.board))
+            for target in iterSquares(PAWN_ATTACKS[allyColour][sq] & enemies & mask):
+                moves.append(Move(startSquare, SQUARE_COORDINATES[target], self.board))
+
+    def getEnpassantBitboardMoves(self, allyColour, enemyColour, kingSq, occupied, moves):
+        if not self.enPassantPossible:
+            return
+        epSq = self.enPassantPossible[0] * 8 + self.enPassantPossible[1]
+        capturedSq = epSq + (8 if allyColour == 'w' else -8)
+        for sq in iterSquares(PAWN_ATTACKS[enemyColour][epSq] & self.pieceBitboards[allyColour + 'p']):
+            # two pawns leave the board and one arrives, so the king is tested against the resulting occupancy
+            occupiedAfter = occupied ^ (1 << sq) ^ (1 << capturedSq) | (1 << epSq)
+            if not self.attackersTo(kingSq, occupiedAfter, enemyColour) & ~(1 << capturedSq):
+                moves.append(Move(SQUARE_COORDINATES[sq], self.enPassantPossible, self.board, isEnpassantMove=True))
@@ -1,6 +1,8 @@
 import pygame as p
+import os
+import queue
 import ChessEngine, SmartMoveFinder
-from multiprocessing import Process, Queue
+from multiprocessing import Process, Queue, Value
 
 p.init()
 p.display.set_caption("Chess")
@@ -23,9 +25,38 @@ SQ_SIZE = BOARD_HEIGHT // DIMENSIONS
 # Limiting the number of frames per second that the game will run at.
 MAX_FPS = 15
 
+# Moves are animated at a higher frame rate, taking this long per square moved up to a limit so that
+# long moves do not hold the game up.
+ANIMATION_FPS = 60
+ANIMATION_SECONDS_PER_SQUARE = 0.1
+MAX_ANIMATION_SECONDS = 0.3
+
+# The number of processes the engine searches with. More than one uses a parallel (Lazy SMP) search.
+SEARCH_THREADS = SmartMoveFinder.SEARCH_THREADS
+
+# Letting the engine think on the human player's time, starting with the reply it expects from them.
+PONDER = True
+
+# Polyglot opening book the engine plays from while the game is in it, used when the file exists.
+OPENING_BOOK = "book.bin"
+
+# Directory of endgame tablebases built with Tablebase.py, used when it exists.
+TABLEBASE_DIR = "tablebases"
+
 # Creating a dictionary of images.
 IMAGES = {}
 
+# The empty board, drawn once by renderBoard and copied to the screen from then on.
+BOARD_SURFACE = None
+
+# The colours of the light and dark squares.
+BOARD_COLOURS = ["white", "gray"]
+
+# Layout of the move log panel.
+MOVES_PER_ROW = 3
+MOVE_LOG_PADDING = 5
+MOVE_LOG_LINE_SPACING = 2
+
 
 def loadImages():
     """
@@ -37,6 +68,129 @@ def loadImages():
         IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
 
 
+def renderBoard():
+    """
+    Draws the squares of the empty board once, so that drawing the board is a single blit
+    """
+
+    global BOARD_SURFACE
+    BOARD_SURFACE = p.Surface((BOARD_WIDTH, BOARD_HEIGHT)).convert()
+    colours = [p.Color(colour) for colour in BOARD_COLOURS]
+    for r in range(DIMENSIONS):
+        for c in range(DIMENSIONS):
+            colour = colours[((r+c) % 2)]
+            p.draw.rect(BOARD_SURFACE, colour, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+
+
+class BoardRenderer():
+    """
+    Remembers what is on the screen, so that each frame only the squares whose piece or highlight
+    has changed are drawn again and only their rectangles are passed to p.display.update
+    """
+
+    def __init__(self, screen, moveLogFont):
+        self.screen = screen
+        self.moveLogPanel = MoveLogPanel(moveLogFont)
+        self.selectedSurface = highlightSurface('blue')
+        self.targetSurface = highlightSurface('yellow')
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Makes the next frame draw everything, for when the screen has been drawn on elsewhere
+        """
+
+        # (piece, highlight) last drawn on each square, None when the square has to be drawn again
+        self.drawnSquares = [None] * (DIMENSIONS * DIMENSIONS)
+        self.moveLogPanel.changed = True
+        self.drawnText = None
+
+    def draw(self, gs, validMoves, squareSelected, endGameText=None):
+        """
+        Draws whatever has changed since the last frame
+        
+        :param gs: the game state
+        :param validMoves: a list of valid moves
+        :param squareSelected: a tuple of the square which is currently selected by the player
+        :param endGameText: the text shown over the board once the game is over, or None
+        :return: a list of the rectangles of the screen which have changed.
+        """
+
+        squares = squareContents(gs, validMoves, squareSelected)
+        if endGameText != self.drawnText:
+            # the text covers most of the board, so every square is drawn again when it appears or goes
+            self.drawnSquares = [None] * (DIMENSIONS * DIMENSIONS)
+        dirtyRects = []
+        for sq, contents in enumerate(squares):
+            if contents != self.drawnSquares[sq]:
+                dirtyRects.append(self.drawSquare(sq // DIMENSIONS, sq % DIMENSIONS, contents))
+        self.drawnSquares = squares
+        if endGameText is not None and dirtyRects:
+            drawEndGameText(self.screen, endGameText)
+            dirtyRects = [p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT)]
+        self.drawnText = endGameText
+
+        # the move log only changes when a move is made, undone or the game is reset, or when it is scrolled
+        self.moveLogPanel.update(gs.moveLog)
+        if self.moveLogPanel.changed:
+            self.screen.blit(self.moveLogPanel.surface, (BOARD_WIDTH, 0))
+            dirtyRects.append(p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT))
+            self.moveLogPanel.changed = False
+        return dirtyRects
+
+    def drawSquare(self, r, c, contents):
+        """
+        Draws one square from the pre-rendered board, with its highlight and piece on top
+        
+        :return: the rectangle of the square.
+        """
+
+        piece, highlight = contents
+        square = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        self.screen.blit(BOARD_SURFACE, square, square)
+        if highlight == 'selected':
+            self.screen.blit(self.selectedSurface, square)
+        elif highlight == 'target':
+            self.screen.blit(self.targetSurface, square)
+        if piece != "--":
+            self.screen.blit(IMAGES[piece], square)
+        return square
+
+
+def highlightSurface(colour):
+    """
+    A see-through square of the given colour which is drawn over highlighted squares
+    """
+
+    s = p.Surface((SQ_SIZE, SQ_SIZE))
+    s.set_alpha(100)
+    s.fill(p.Color(colour))
+    return s
+
+
+def squareContents(gs, validMoves, squareSelected):
+    """
+    Works out what should be shown on each square
+    
+    :param gs: the game state
+    :param validMoves: a list of valid moves
+    :param squareSelected: a tuple of the square which is currently selected by the player
+    :return: a list of (piece, highlight) for each square, indexed by row * 8 + col, where highlight is
+    'selected' for the selected piece, 'target' for the squares it can move to, or None.
+    """
+
+    highlights = [None] * (DIMENSIONS * DIMENSIONS)
+    # the selected square and the moves from it are only highlighted for a piece of the player to move
+    if squareSelected != ():
+        r, c = squareSelected
+        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
+            highlights[r*DIMENSIONS + c] = 'selected'
+            for move in validMoves:
+                if move.startRow == r and move.startCol == c:
+                    highlights[move.endRow*DIMENSIONS + move.endCol] = 'target'
+    return [(piece, highlights[r*DIMENSIONS + c]) for r, row in enumerate(gs.board) for c, piece in enumerate(row)]
+
+
 def main():
 
 
@@ -47,13 +201,18 @@ def main():
     moveLogFont = p.font.SysFont("Arial", 16, False, False)
 
     # Initializing the game state.
-    gs = ChessEngine.GameState()
+    gs = ChessEngine.BitboardGameState()
     # Getting the valid moves for the current player.
     validMoves = gs.getValidMoves()
 
     moveMade = False
     animate = False
+    # The move being animated. The main loop keeps handling events while it runs.
+    animation = None
     loadImages()
+    renderBoard()
+    # Only the parts of the screen which have changed are drawn each frame.
+    renderer = BoardRenderer(screen, moveLogFont)
     running = True
     squareSelected = ()
     playerClicks = []
@@ -61,9 +220,27 @@ def main():
     playerOne = True
     playerTwo = False
     AIThinking = False
-    moveFinderProcess = None
     moveUndone = False
 
+    # Starting one engine process for the whole session. It keeps its own copy of the game, so only
+    # the moveIDs of the game are sent with each search and its transposition table stays warm.
+    requestQueue = Queue()
+    responseQueue = Queue()
+    # the highest search request which has been cancelled, checked by the engine while it searches
+    cancelledRequest = Value('i', 0)
+    # the highest ponder request whose expected reply the human player has made
+    ponderHit = Value('i', 0)
+    searchRequest = 0
+    # the request the engine is pondering with during the human player's turn, and the move it expects from them
+    ponderRequest = None
+    ponderMoveID = None
+    # A daemon process may not start processes of its own, so the engine is only one when it searches alone.
+    engineProcess = Process(target=SmartMoveFinder.engineWorker, daemon=SEARCH_THREADS == 1,
+                            args=(requestQueue, responseQueue, cancelledRequest, ChessEngine.BitboardGameState, SEARCH_THREADS,
+                                  ponderHit, OPENING_BOOK if os.path.exists(OPENING_BOOK) else None,
+                                  TABLEBASE_DIR if os.path.isdir(TABLEBASE_DIR) else None))
+    engineProcess.start()
+
     while running:
 
         # A way to check if the current player is human or not.
@@ -76,8 +253,16 @@ def main():
 
                 running = False
 
+            # The window has been uncovered, so everything on it is drawn again.
+            elif e.type == p.VIDEOEXPOSE or e.type == p.WINDOWEXPOSED:
+                renderer.invalidate()
+
+            # Scrolling the move log with the mouse wheel.
+            elif e.type == p.MOUSEWHEEL:
+                renderer.moveLogPanel.scroll(-e.y)
 
-            elif e.type == p.MOUSEBUTTONDOWN:
+            # The mouse wheel also sends button presses, which are not clicks on the board.
+            elif e.type == p.MOUSEBUTTONDOWN and e.button not in (4, 5):
                 if not gameOver:
                     location = p.mouse.get_pos()
                     col = location[0] // SQ_SIZE
@@ -108,43 +293,61 @@ def main():
                     moveMade = True
                     animate = False
                     gameOver = False
-                    if AIThinking:
-                        # Terminating the process that is running the move finder.
-                        moveFinderProcess.terminate()
-                        AIThinking = False
+                    # Asking the engine to stop searching or pondering the position which has just been undone.
+                    cancelledRequest.value = searchRequest
+                    AIThinking = False
+                    ponderRequest = None
                     moveUndone = True
                     
                 if e.key == p.K_r:
-                    gs = ChessEngine.GameState()
+                    gs = ChessEngine.BitboardGameState()
                     validMoves = gs.getValidMoves()
                     squareSelected = ()
                     playerClicks = []
                     moveMade = False
                     animate = False
                     gameOver = False
-                    if AIThinking:
-                        moveFinderProcess.terminate()
-                        AIThinking = False
+                    cancelledRequest.value = searchRequest
+                    AIThinking = False
+                    ponderRequest = None
+                    requestQueue.put(("newgame",))
                     moveUndone = True
+                    # Stopping any animation of the old game.
+                    animation = None
+                    renderer.invalidate()
+
+        # Checking for a message from the engine without waiting, so the window keeps responding while it thinks.
+        try:
+            response = responseQueue.get_nowait()
+        except queue.Empty:
+            response = None
+        if response is not None and response[0] == "ponder" and response[1] == ponderRequest:
+            ponderMoveID = response[2]
 
         # This is the code that is running the simulation of the game.
         if not gameOver and not humanTurn and not moveUndone:
             if not AIThinking:
                 AIThinking = True
                 print("thinking...")
-                # The below code is creating a queue that will be used to send data from the child
-                # process back to the parent process.
-                returnQueue = Queue()
-                # This is a multiprocessing function that is used to find the best move.
-                moveFinderProcess = Process(target=SmartMoveFinder.findBestMove, args=(gs, validMoves, returnQueue))
-                # Starting a new process that will run the moveFinder.py script.
-                moveFinderProcess.start()
-
-            # This is checking if the process is still running. If it is not running, then it is done.
-            if not moveFinderProcess.is_alive():
+                if ponderRequest is not None and ponderMoveID is not None and gs.moveLog[-1].moveID == ponderMoveID:
+                    # The human player made the move the engine expected, so it carries on with the search it
+                    # started on their time and answers that request.
+                    ponderHit.value = ponderRequest
+                else:
+                    if ponderRequest is not None:
+                        cancelledRequest.value = ponderRequest
+                    # Sending the engine the game so far and asking it to search the current position.
+                    searchRequest += 1
+                    requestQueue.put(("search", searchRequest, [move.moveID for move in gs.moveLog]))
+                ponderRequest = None
+
+            # Answers to searches which have since been cancelled are ignored.
+            if response is not None and response[0] == "bestmove" and response[1] == searchRequest:
                 print("done thinking")
-                # Getting the move from the queue and returning it.
-                AIMove = returnQueue.get()
+                AIMove = None
+                for move in validMoves:
+                    if move.moveID == response[2]:
+                        AIMove = move
                 # Checking if the move is None. If it is, then it is not a valid move.
                 if AIMove is None:
                     AIMove = SmartMoveFinder.findRandomMove(validMoves)
@@ -153,49 +356,57 @@ def main():
                 moveMade = True
                 animate = True
                 AIThinking = False
+                if PONDER and ((gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)):
+                    # Asking the engine to keep thinking while the human player decides on their move.
+                    searchRequest += 1
+                    ponderRequest = searchRequest
+                    ponderMoveID = None
+                    requestQueue.put(("ponder", ponderRequest, [move.moveID for move in gs.moveLog]))
 
 
         if moveMade:
+            # A move made while another is being animated replaces that animation, and an undo stops it.
+            if animation is not None:
+                animation = None
+                renderer.invalidate()
             if animate:
                 # Animating the last move in the move log.
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
+                animation = MoveAnimation(gs.moveLog[-1], gs.board)
             # Getting all the valid moves for the current player.
             validMoves = gs.getValidMoves()
             moveMade = False
             animate = False
             moveUndone = False
 
-        # Drawing the game state.
-        drawGameState(screen, gs, validMoves, squareSelected, moveLogFont)
-
         # This is checking if the game is over by checkmate or stalemate. If it is, then it will set
-        # the gameOver variable to True and set the text to the appropriate message. Then it will draw
-        # the text on the screen.
+        # the gameOver variable to True and set the text to the appropriate message, which is drawn
+        # over the board.
+        text = None
         if gs.checkmate or gs.stalemate:
             gameOver = True
             text =  'Stalemate' if gs.stalemate else 'Black wins by checkmate' if gs.whiteToMove else 'White wins by checkmate'
-            drawEndGameText(screen, text)
 
-        # Creating a clock object that will be used to control the frame rate of the game.
-        clock.tick(MAX_FPS)
-        # Updating the screen.
-        p.display.flip()
+        dirtyRects = []
+        if animation is not None:
+            # Only the moving piece is drawn until it lands, then everything is drawn again.
+            dirtyRects += animation.draw(screen)
+            if animation.finished:
+                animation = None
+                renderer.invalidate()
+        if animation is None:
+            # Drawing what has changed in the game state.
+            dirtyRects += renderer.draw(gs, validMoves, squareSelected, text)
 
-def drawGameState(screen, gs, validMoves, squareSelected, moveLogFont):
-    """
-    Draws the game state to the screen
-    
-    :param screen: the pygame screen object
-    :param gs: the game state
-    :param validMoves: a list of valid moves
-    :param squareSelected: a tuple containing the coords of the square selected (in
-    :param moveLogFont: The font to use for the move log
-    """
+        # Creating a clock object that will be used to control the frame rate of the game.
+        clock.tick(MAX_FPS if animation is None else ANIMATION_FPS)
+        # Updating only the changed parts of the screen, and nothing at all when nothing has changed.
+        if dirtyRects:
+            p.display.update(dirtyRects)
 
-    drawBoard(screen)
-    highlightSquares(screen, gs, validMoves, squareSelected)
-    drawPieces(screen, gs.board)
-    drawMoveLog(screen, gs, moveLogFont)
+    # Stopping any search in progress and shutting the engine process down.
+    cancelledRequest.value = searchRequest
+    requestQueue.put(("quit",))
+    engineProcess.join(timeout=1)
 
 def drawBoard(screen):
     """
@@ -204,33 +415,7 @@ def drawBoard(screen):
     :param screen: the screen to draw the board on
     """
 
-    colours = [p.Color("white"), p.Color("gray")]
-    for r in range(DIMENSIONS):
-        for c in range(DIMENSIONS):
-            colour = colours[((r+c) % 2)]
-            p.draw.rect(screen, colour, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-def highlightSquares(screen, gs, validMoves, squareSelected):
-    """
-    This function highlights the squares that are valid moves for the selected piece
-    
-    :param screen: the display variable
-    :param gs: the global state of the game
-    :param validMoves: a list of valid moves. For example, it would be [3, 5, 12, 20]
-    :param squareSelected: a tuple of the square which is currently selected by the player
-    """
-
-    if squareSelected != ():
-        r, c = squareSelected
-        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100)
-            s.fill(p.Color('blue'))
-            screen.blit(s, (c*SQ_SIZE, r*SQ_SIZE))
-            s.fill(p.Color('yellow'))
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (move.endCol*SQ_SIZE, move.endRow*SQ_SIZE))
+    screen.blit(BOARD_SURFACE, (0, 0))
 
 def drawPieces(screen, board):
     """
@@ -246,70 +431,148 @@ def drawPieces(screen, board):
             if piece != "--":
                 screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
-def drawMoveLog(screen, gs, font):
+class MoveLogPanel():
     """
-    Draws the move log.
-    
-    :param screen: the pygame screen object
-    :param gs: the game state
-    :param font: the font object that has been used to render the text
+    The move log shown beside the board. Each line of text is rendered once and kept, so a new move
+    only renders the line it goes on, however long the game is. Undoing a move or starting a new game
+    drops the lines from the first move which is no longer in the log.
     """
 
+    def __init__(self, font):
+        """
+        :param font: the font object used to render the text
+        """
+        self.font = font
+        self.lineHeight = font.get_height() + MOVE_LOG_LINE_SPACING
+        self.visibleLines = (MOVE_LOG_PANEL_HEIGHT - MOVE_LOG_PADDING) // self.lineHeight
+        # the moves the lines were rendered from, and the rendered lines
+        self.moves = []
+        self.lines = []
+        # the first line shown, and whether the view moves down to follow new moves
+        self.scrollLine = 0
+        self.following = True
+        self.surface = p.Surface((MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)).convert()
+        self.changed = True
+        self.compose()
+
+    def update(self, moveLog):
+        """
+        Renders the lines of any moves which are new since the last update
+        
+        :param moveLog: the move log of the game state
+        """
+
+        # the moves which are still the same are found from the end, as only the last few ever change
+        kept = min(len(self.moves), len(moveLog))
+        while kept > 0 and self.moves[kept - 1] is not moveLog[kept - 1]:
+            kept -= 1
+        if kept == len(self.moves) == len(moveLog):
+            return
+        self.moves = self.moves[:kept] + moveLog[kept:]
+        pliesPerLine = 2 * MOVES_PER_ROW
+        firstLine = kept // pliesPerLine
+        del self.lines[firstLine:]
+        for i in range(firstLine * pliesPerLine, len(self.moves), pliesPerLine):
+            self.lines.append(self.font.render(self.lineText(i), True, p.Color('white')))
+        lastScrollLine = max(0, len(self.lines) - self.visibleLines)
+        self.scrollLine = lastScrollLine if self.following else min(self.scrollLine, lastScrollLine)
+        self.compose()
+
+    def lineText(self, start):
+        """
+        The text of the line which starts with the move at index start of the move log
+        """
 
-    moveLogRect = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
-    p.draw.rect(screen, p.Color("black"), moveLogRect)
-    moveLog = gs.moveLog
-    moveTexts = []
-    for i in range(0, len(moveLog), 2):
-        moveString = str(i//2 + 1) + ". " + str(moveLog[i]) + " "
-        if i+1 < len(moveLog):
-            moveString += str(moveLog[i+1]) + "  "
-        moveTexts.append(moveString)
-    
-    movesPerRow = 3
-    padding = 5
-    lineSpacing = 2
-    textY = padding
-    for i in range(0, len(moveTexts), movesPerRow):
         text = ""
-        for j in range(movesPerRow):
-            if i+j < len(moveTexts):
-                text += moveTexts[i+j]
-        textObject = font.render(text, True, p.Color('white'))  
-        textLocation = moveLogRect.move(padding, textY)
-        screen.blit(textObject, textLocation)
-        textY += textObject.get_height() + lineSpacing
-
-def animateMove(move, screen, board, clock):
+        for i in range(start, min(start + 2 * MOVES_PER_ROW, len(self.moves)), 2):
+            text += str(i//2 + 1) + ". " + str(self.moves[i]) + " "
+            if i+1 < len(self.moves):
+                text += str(self.moves[i+1]) + "  "
+        return text
+
+    def scroll(self, lines):
+        """
+        Moves the view down (or up for a negative number) by a number of lines
+        """
+
+        lastScrollLine = max(0, len(self.lines) - self.visibleLines)
+        scrollLine = min(max(self.scrollLine + lines, 0), lastScrollLine)
+        self.following = scrollLine == lastScrollLine
+        if scrollLine != self.scrollLine:
+            self.scrollLine = scrollLine
+            self.compose()
+
+    def compose(self):
+        """
+        Draws the lines which are in view onto the panel surface
+        """
+
+        self.surface.fill(p.Color("black"))
+        textY = MOVE_LOG_PADDING
+        for line in self.lines[self.scrollLine:self.scrollLine + self.visibleLines]:
+            self.surface.blit(line, (MOVE_LOG_PADDING, textY))
+            textY += self.lineHeight
+        self.changed = True
+
+class MoveAnimation():
     """
-    This function takes a move, a screen, a board, and a clock, and animates the move
-    
-    :param move: a Move object
-    :param screen: the pygame screen object
-    :param board: the game board surface
-    :param clock: the pygame clock object
+    Slides the piece of a move from its start square to its end square. The board without the moving
+    piece is drawn once, and each frame only the square the piece was last drawn on is copied back
+    from it before the piece is drawn in its new place.
     """
 
-    colours = [p.Color("white"), p.Color("gray")]
-    dR = move.endRow - move.startRow
-    dC = move.endCol - move.startCol
-    framesPerSquare = 10
-    frameCount = (abs(dR) + abs(dC)) * framesPerSquare
-    for frame in range(frameCount + 1):
-        r, c = ((move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount))
-        drawBoard(screen)
-        drawPieces(screen, board)
-        colour = colours[(move.endRow + move.endCol) % 2]
+    def __init__(self, move, board):
+        """
+        :param move: a Move object, which has already been made
+        :param board: a 2D list containing the pieces on the board after the move
+        """
+
+        self.move = move
+        self.background = p.Surface((BOARD_WIDTH, BOARD_HEIGHT)).convert()
+        drawBoard(self.background)
+        drawPieces(self.background, board)
+        # the end square is empty until the piece lands, apart from a piece which is being captured
         endSquare = p.Rect(move.endCol*SQ_SIZE, move.endRow*SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, colour, endSquare)
+        self.background.blit(BOARD_SURFACE, endSquare, endSquare)
         if move.pieceCaptured != '--':
-            if move.isEnpassantMove:
-                enPassantRow = move.endRow + 1 if move.pieceCaptured[0] == 'b' else move.endRow - 1
-                endSquare = p.Rect(move.endCol * SQ_SIZE, enPassantRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
-        clock.tick(60)
+            # a pawn taken en passant is beside the start square rather than on the end square
+            capturedRow = move.startRow if move.isEnpassantMove else move.endRow
+            self.background.blit(IMAGES[move.pieceCaptured], (move.endCol*SQ_SIZE, capturedRow*SQ_SIZE))
+        distance = abs(move.endRow - move.startRow) + abs(move.endCol - move.startCol)
+        self.duration = min(distance * ANIMATION_SECONDS_PER_SQUARE, MAX_ANIMATION_SECONDS)
+        self.startTime = None
+        self.pieceRect = None
+        self.finished = False
+
+    def draw(self, screen):
+        """
+        Draws the piece where it should be by now
+        
+        :param screen: the pygame screen object
+        :return: a list of the rectangles of the screen which have changed.
+        """
+
+        now = p.time.get_ticks() / 1000
+        if self.startTime is None:
+            # the first frame puts the whole background on the screen
+            self.startTime = now
+            screen.blit(self.background, (0, 0))
+            dirtyRects = [p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT)]
+        else:
+            screen.blit(self.background, self.pieceRect, self.pieceRect)
+            dirtyRects = [self.pieceRect]
+        # the piece's position follows the time taken, so frames which come late do not slow it down
+        progress = (now - self.startTime) / self.duration
+        if progress >= 1:
+            self.finished = True
+            return dirtyRects
+        move = self.move
+        r = move.startRow + (move.endRow - move.startRow) * progress
+        c = move.startCol + (move.endCol - move.startCol) * progress
+        self.pieceRect = p.Rect(round(c*SQ_SIZE), round(r*SQ_SIZE), SQ_SIZE, SQ_SIZE)
+        screen.blit(IMAGES[move.pieceMoved], self.pieceRect)
+        dirtyRects.append(self.pieceRect)
+        return dirtyRects
 
 def drawEndGameText(screen, text):
     """
@@ -0,0 +1,295 @@
+import queue
+import sys
+import threading
+import time
+
+import ChessEngine
+import PolyglotBook
+import SmartMoveFinder
+
+# Universal Chess Interface front end. Reads commands from stdin and writes answers to stdout, so
+# the engine can be run by chess GUIs, match managers and scripts without pygame or a display.
+
+ENGINE_NAME = "CHESS-AI"
+ENGINE_AUTHOR = "ranjsidhu"
+START_FEN = ChessEngine.START_FEN
+
+# share of the remaining clock used for one move when the number of moves to go is not given
+DEFAULT_MOVES_TO_GO = 30
+# share of the increment added to each move's time
+INCREMENT_SHARE = 0.75
+# never plan to use more than this fraction of the remaining clock on one move
+MAX_CLOCK_SHARE = 0.5
+# seconds kept back from each move for the time it takes to send the answer
+MOVE_OVERHEAD = 0.05
+MIN_MOVE_TIME = 0.01
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+
+
+def moveToUci(move):
+    """The UCI text of a move, e.g. e2e4, or e7e8q for a promotion"""
+    return move.getChessNotation() + ("q" if move.isPawnPromotion else "")
+
+
+def uciToMoveID(text):
+    """
+    The moveID of a move in UCI text. The engine only promotes to a queen, so the promotion piece
+    is ignored.
+    """
+    if len(text) not in (4, 5) or text[0] not in "abcdefgh" or text[1] not in "12345678" or \
+            text[2] not in "abcdefgh" or text[3] not in "12345678":
+        raise ValueError("not a UCI move: " + text)
+    startCol, startRow = ord(text[0]) - ord("a"), 8 - int(text[1])
+    endCol, endRow = ord(text[2]) - ord("a"), 8 - int(text[3])
+    return (startRow * 8 + startCol) << 6 | endRow * 8 + endCol
+
+
+def uciScore(score):
+    """The UCI score of a search score --> "cp N" in centipawns or "mate N" in moves"""
+    if abs(score) >= SmartMoveFinder.MATE_SCORE_THRESHOLD:
+        # mate scores count the plies to mate from the root
+        plies = SmartMoveFinder.CHECKMATE - abs(score)
+        moves = max(1, (plies + 1) // 2)
+        return "mate %d" % (moves if score > 0 else -moves)
+    return "cp %d" % round(score * 100)
+
+
+def timeForMove(remaining, increment=0, movesToGo=None):
+    """
+    Works out how long to search for from the clock
+
+    :param remaining: the milliseconds left on the clock
+    :param increment: the milliseconds added after each move
+    :param movesToGo: the moves until the next time control, or None
+    :return: the number of seconds to search for.
+    """
+    moveTime = remaining / (movesToGo or DEFAULT_MOVES_TO_GO) + increment * INCREMENT_SHARE
+    moveTime = min(moveTime, remaining * MAX_CLOCK_SHARE) / 1000 - MOVE_OVERHEAD
+    return max(moveTime, MIN_MOVE_TIME)
+
+
+class UCIEngine():
+    """
+    Keeps the position and options of a UCI session and runs searches on a separate thread, so that
+    stop, ponderhit and isready are answered while the engine is thinking.
+    """
+
+    def __init__(self, output=sys.stdout):
+        """
+        :param output: the stream answers are written to
+        """
+        self.output = output
+        self.outputLock = threading.Lock()
+        self.gs = ChessEngine.BitboardGameState()
+        self.fen = START_FEN
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+        self.ponderHitEvent = threading.Event()
+        self.threads = 1
+        self.hashSize = SmartMoveFinder.TT_SIZE_MB
+        self.ponder = False
+        self.book = None
+        self.searchStart = 0.0
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        """
+        Carries out one command
+
+        :param line: the command as read from the input
+        :return: False once the engine should quit, otherwise True
+        """
+        words = line.split()
+        if not words:
+            return True
+        command = words[0]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %d min 1 max %d" % (SmartMoveFinder.TT_SIZE_MB, MAX_HASH_MB))
+            self.send("option name Threads type spin default 1 min 1 max %d" % MAX_THREADS)
+            self.send("option name Ponder type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebaseDir type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.setOption(words)
+        elif command == "ucinewgame":
+            self.stopSearch()
+            SmartMoveFinder.transpositionTable.clear()
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(words)
+        elif command == "go":
+            self.stopSearch()
+            self.go(words)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "ponderhit":
+            self.ponderHitEvent.set()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        return True
+
+    def setOption(self, words):
+        # setoption name <name> value <value>
+        text = " ".join(words[1:])
+        name, value = text, ""
+        if " value " in text:
+            name, value = text.split(" value ", 1)
+        name = name.replace("name", "", 1).strip().lower()
+        value = value.strip()
+        if name == "hash":
+            self.hashSize = max(1, min(MAX_HASH_MB, int(value)))
+            if isinstance(SmartMoveFinder.transpositionTable, SmartMoveFinder.SharedTranspositionTable):
+                SmartMoveFinder.transpositionTable.close()
+            SmartMoveFinder.transpositionTable = SmartMoveFinder.TranspositionTable(self.hashSize)
+        elif name == "threads":
+            self.threads = max(1, min(MAX_THREADS, int(value)))
+        elif name == "ponder":
+            self.ponder = value.lower() == "true"
+        elif name == "bookfile":
+            if self.book is not None:
+                self.book.close()
+            self.book = PolyglotBook.PolyglotBook(value) if value and value != "<empty>" else None
+        elif name == "tablebasedir":
+            if value and value != "<empty>":
+                SmartMoveFinder.useTablebases(value)
+            else:
+                SmartMoveFinder.tablebases = None
+
+    def setPosition(self, words):
+        # position [startpos | fen <fen>] [moves <move1> ... <movei>]
+        movesAt = words.index("moves") if "moves" in words else len(words)
+        if words[1] == "fen":
+            fen = " ".join(words[2:movesAt])
+        else:
+            fen = START_FEN
+        moveTexts = words[movesAt + 1:]
+        moveIDs = []
+        for text in moveTexts:
+            try:
+                moveIDs.append(uciToMoveID(text))
+            except ValueError:
+                break
+        if fen != self.fen:
+            try:
+                gs = ChessEngine.BitboardGameState(fen)
+            except ValueError as e:
+                # the engine stays at the last position it was sent
+                self.send("info string bad position: %s" % e)
+                return
+            self.gs = gs
+            self.fen = fen
+        # only the moves which differ from the last position sent are taken back and played again
+        try:
+            SmartMoveFinder.syncGameState(self.gs, moveIDs)
+        except ValueError:
+            pass
+        # a move which cannot be played is reported, and the game stops at the position before it
+        if len(self.gs.moveLog) < len(moveTexts):
+            self.send("info string illegal move %s, ignoring it and the moves after it" % moveTexts[len(self.gs.moveLog)])
+
+    def go(self, words):
+        # go [ponder] [infinite] [depth N] [nodes N] [movetime MS] [wtime MS] [btime MS] [winc MS] [binc MS] [movestogo N]
+        values = {}
+        for i, word in enumerate(words[:-1]):
+            if word in ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo"):
+                values[word] = int(words[i + 1])
+        white = self.gs.whiteToMove
+        if "movetime" in values:
+            timeLimit = max(values["movetime"] / 1000 - MOVE_OVERHEAD, MIN_MOVE_TIME)
+        elif ("wtime" if white else "btime") in values:
+            timeLimit = timeForMove(values["wtime" if white else "btime"], values.get("winc" if white else "binc", 0),
+                                    values.get("movestogo"))
+        elif "depth" in values or "nodes" in values or "infinite" in words:
+            timeLimit = None
+        else:
+            timeLimit = SmartMoveFinder.TIME_LIMIT
+        pondering = "ponder" in words
+        infinite = "infinite" in words
+        self.stopEvent.clear()
+        self.ponderHitEvent.clear()
+        self.searchThread = threading.Thread(target=self.search, daemon=True, args=(
+            timeLimit, values.get("nodes"), values.get("depth", SmartMoveFinder.MAX_DEPTH), pondering, infinite))
+        self.searchThread.start()
+
+    def stopSearch(self):
+        """Stops the search if there is one, and waits for it to send its best move"""
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+    def search(self, timeLimit, nodeLimit, maxDepth, pondering, infinite):
+        """
+        Runs on the search thread. While pondering the search has no time limit; a ponderhit gives it
+        timeLimit from then on. An infinite or ponder search only answers once it is stopped, or on a
+        ponderhit, even if it finishes sooner.
+        """
+        gs = self.gs
+        validMoves = gs.getValidMoves()
+        self.searchStart = time.time()
+        move = self.book.chooseMove(gs, validMoves) if self.book is not None and not pondering else None
+        if move is None and validMoves:
+            waitingForPonderHit = [pondering]
+
+            def stopCheck():
+                if waitingForPonderHit[0] and self.ponderHitEvent.is_set():
+                    waitingForPonderHit[0] = False
+                    if timeLimit is not None:
+                        SmartMoveFinder.searchDeadline = time.time() + timeLimit
+                return self.stopEvent.is_set()
+
+            if self.threads > 1:
+                SmartMoveFinder.useSharedTranspositionTable(self.hashSize)
+            returnQueue = queue.Queue()
+            SmartMoveFinder.findBestMoveParallel(gs, validMoves, returnQueue, self.threads,
+                                                 None if pondering else timeLimit, nodeLimit, maxDepth, stopCheck,
+                                                 onIteration=self.sendInfo)
+            move = returnQueue.get()
+        # the protocol does not allow an answer before stop (or ponderhit) in these modes
+        while (infinite or pondering) and not self.stopEvent.is_set() and not (pondering and self.ponderHitEvent.is_set()):
+            time.sleep(SmartMoveFinder.PONDER_POLL_INTERVAL)
+        if move is None:
+            self.send("bestmove 0000")
+            return
+        answer = "bestmove " + moveToUci(move)
+        gs.makeMove(move)
+        variation = SmartMoveFinder.getPrincipalVariation(gs, 1)
+        gs.undoMove()
+        if variation:
+            answer += " ponder " + moveToUci(variation[0])
+        self.send(answer)
+
+    def sendInfo(self, info):
+        elapsed = time.time() - self.searchStart
+        variation = SmartMoveFinder.getPrincipalVariation(self.gs, max(info["depth"], 1))
+        if not variation or variation[0].moveID != info["move"].moveID:
+            variation = [info["move"]]
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (
+            info["depth"], uciScore(info["score"]), info["nodes"], info["nodes"] / elapsed if elapsed > 0 else 0,
+            elapsed * 1000, " ".join(moveToUci(move) for move in variation)))
+
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    # a search still running when the input ends is finished so that its best move is sent
+    engine.stopSearch()
+    if isinstance(SmartMoveFinder.transpositionTable, SmartMoveFinder.SharedTranspositionTable):
+        SmartMoveFinder.transpositionTable.close()
+
+
+if __name__ == '__main__':
+    main()
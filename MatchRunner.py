@@ -0,0 +1,343 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import time
+
+import ChessEngine
+import SmartMoveFinder
+from BatchAnalyser import parseRecord, readRecords
+from ChessUCI import moveToUci
+
+# Plays two engine configurations against each other without a display. Games are played on a pool
+# of worker processes from a list of opening positions, each opening once with each side as white.
+# After every game the Elo difference and a sequential probability ratio test (SPRT) are updated, and
+# the match stops as soon as the test can tell whether the change is an improvement.
+
+# Evaluations an engine can be given by name. Each is passed to SmartMoveFinder.useEvaluation, so a
+# table which is left out is the same as in the default evaluation.
+EVALUATIONS = {
+    "default": {},
+    "material": {"positionWeight": 0},
+    "positional": {"positionWeight": 2 * SmartMoveFinder.DEFAULT_POSITION_WEIGHT},
+}
+
+DEFAULT_ENGINE = {"name": None, "depth": SmartMoveFinder.DEPTH, "time": None, "nodes": None, "eval": "default"}
+
+# balanced positions a few moves into well known openings
+DEFAULT_OPENINGS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2",
+    "rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq c3 0 2",
+    "rnbqkbnr/pppp1ppp/4p3/8/3PP3/8/PPP2PPP/RNBQKBNR b KQkq d3 0 2",
+    "rnbqkb1r/pppppppp/5n2/8/2P5/8/PP1PPPPP/RNBQKBNR w KQkq - 1 2",
+    "rnbqkbnr/pp1ppppp/2p5/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+]
+
+DEFAULT_GAMES = 1000
+# a game this long is stopped and scored as a draw
+MAX_GAME_PLIES = 400
+# plies without a capture or pawn move before the fifty-move rule applies
+FIFTY_MOVE_PLIES = 100
+# SPRT defaults --> H0: the new engine is no better (elo0), H1: it is elo1 stronger
+ELO0 = 0.0
+ELO1 = 10.0
+ALPHA = 0.05
+BETA = 0.05
+# z value of the 95% confidence interval of the Elo difference
+CONFIDENCE_Z = 1.96
+
+# state of each worker process --> set up once by initWorker and reused for every game
+workerState = None
+
+
+def parseEngine(text):
+    """
+    Reads an engine configuration from the command line
+
+    :param text: comma separated settings, e.g. 'name=new,depth=4,time=0.5,nodes=20000,eval=material'
+    :return: a dictionary of the name, depth, time, nodes and evaluation of the engine.
+    """
+    engine = dict(DEFAULT_ENGINE)
+    for setting in text.split(","):
+        key, _, value = setting.partition("=")
+        key = key.strip()
+        if key not in engine:
+            raise ValueError("unknown engine setting '%s', expected one of %s" % (key, ", ".join(engine)))
+        if key == "depth" or key == "nodes":
+            engine[key] = int(value)
+        elif key == "time":
+            engine[key] = float(value)
+        else:
+            engine[key] = value.strip()
+    if engine["eval"] not in EVALUATIONS and not os.path.exists(engine["eval"]):
+        raise ValueError("unknown evaluation '%s', expected one of %s or a JSON file" % (
+            engine["eval"], ", ".join(EVALUATIONS)))
+    engine["name"] = engine["name"] or text
+    return engine
+
+
+def loadEvaluation(name):
+    """
+    The evaluation tables of an engine
+
+    :param name: a name in EVALUATIONS, or a JSON file with any of pieceValues, positionScores and positionWeight
+    :return: the keyword arguments of SmartMoveFinder.useEvaluation.
+    """
+    if name in EVALUATIONS:
+        return EVALUATIONS[name]
+    with open(name) as f:
+        return json.load(f)
+
+
+def drawReason(gs):
+    """
+    Checks the draw rules which are not part of move generation
+
+    :param gs: the game state
+    :return: 'fifty-move rule', 'repetition' or 'insufficient material' if the game is drawn, otherwise None.
+    """
+    if gs.halfmoveClock >= FIFTY_MOVE_PLIES:
+        return "fifty-move rule"
+    # only positions since the last capture or pawn move can be repeated, and only with the same side to move
+    history = gs.keyHistory()
+    earlier = history[max(0, len(history) - gs.halfmoveClock):] if gs.halfmoveClock else []
+    if earlier[-2::-2].count(gs.zobristKey) >= 2:
+        return "repetition"
+    if insufficientMaterial(gs.board):
+        return "insufficient material"
+    return None
+
+
+def insufficientMaterial(board):
+    """True if neither side can ever checkmate --> bare kings, one minor piece, or bishops all on one colour"""
+    minors = []
+    for r, row in enumerate(board):
+        for c, square in enumerate(row):
+            if square == '--' or square[1] == 'K':
+                continue
+            if square[1] in 'pRQ':
+                return False
+            minors.append((square[1], (r + c) % 2))
+    if len(minors) <= 1:
+        return True
+    return all(piece == 'B' and colour == minors[0][1] for piece, colour in minors)
+
+
+def initWorker(hashSize):
+    """Sets up a worker process --> a transposition table for each of the two engines"""
+    global workerState
+    # Ctrl+C is handled by the main process, which stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    workerState = {"tables": [SmartMoveFinder.TranspositionTable(hashSize), SmartMoveFinder.TranspositionTable(hashSize)]}
+
+
+def playGame(task):
+    """
+    Runs in a worker process and plays one game
+
+    :param task: (game number, opening FEN, the two engine configurations, index of the engine playing white)
+    :return: a dictionary of the game --> its result from white's point of view, how it ended and its moves.
+    """
+    gameNumber, opening, engines, white = task
+    tables = workerState["tables"]
+    for table in tables:
+        table.clear()
+    evaluations = [loadEvaluation(engine["eval"]) for engine in engines]
+    # the random choice between equal moves differs between games but is the same every time a game is replayed
+    random.seed(gameNumber)
+    gs = ChessEngine.BitboardGameState(opening)
+    moves = []
+    result, reason = "1/2-1/2", "adjudicated"
+    returnQueue = queue.Queue()
+    while len(moves) < MAX_GAME_PLIES:
+        validMoves = gs.getValidMoves()
+        if gs.checkmate:
+            result, reason = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+            break
+        if gs.stalemate:
+            reason = "stalemate"
+            break
+        draw = drawReason(gs)
+        if draw is not None:
+            reason = draw
+            break
+        side = white if gs.whiteToMove else 1 - white
+        engine = engines[side]
+        # each engine searches with its own table, as the scores of one evaluation mean nothing to the other
+        SmartMoveFinder.transpositionTable = tables[side]
+        SmartMoveFinder.useEvaluation(**evaluations[side])
+        SmartMoveFinder.findBestMove(gs, validMoves, returnQueue, engine["time"], engine["nodes"], engine["depth"])
+        move = returnQueue.get()
+        if move is None:
+            move = validMoves[0]  # the budget ran out before the first iteration finished
+        moves.append(moveToUci(move))
+        gs.makeMove(move)
+    return {"game": gameNumber, "opening": opening, "white": engines[white]["name"], "black": engines[1 - white]["name"],
+            "result": result, "reason": reason, "plies": len(moves), "moves": " ".join(moves)}
+
+
+def expectedScore(elo):
+    """The expected score of a player elo points stronger than their opponent"""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def eloDifference(wins, draws, losses):
+    """
+    Works out the Elo difference from the results of a match
+
+    :return: a tuple of (Elo difference, half the width of its 95% confidence interval).
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = CONFIDENCE_Z * math.sqrt(variance / games)
+
+    def elo(s):
+        s = min(max(s, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / s - 1)
+
+    return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+
+def sprtLogLikelihoodRatio(wins, draws, losses, elo0=ELO0, elo1=ELO1):
+    """
+    The log-likelihood ratio of H1 (the engine is elo1 stronger) against H0 (it is elo0 stronger),
+    using the normal approximation of the score of a game
+
+    :return: the log-likelihood ratio, or 0 while every game has had the same result.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance == 0:
+        return 0.0
+    score0 = expectedScore(elo0)
+    score1 = expectedScore(elo1)
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def sprtBounds(alpha=ALPHA, beta=BETA):
+    """The log-likelihood ratios at which H0 (lower) and H1 (upper) are accepted"""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def gameTasks(engines, openings, games):
+    # the games come in pairs which play the same opening with the colours swapped
+    for gameNumber in range(games):
+        yield gameNumber, openings[(gameNumber // 2) % len(openings)], engines, gameNumber % 2
+
+
+def runMatch(engines, openings=DEFAULT_OPENINGS, games=DEFAULT_GAMES, processes=None, hashSize=SmartMoveFinder.TT_SIZE_MB,
+             elo0=ELO0, elo1=ELO1, alpha=ALPHA, beta=BETA, sprt=True, outputPath=None):
+    """
+    Plays a match between two engines, stopping early once the SPRT accepts either hypothesis
+
+    :param engines: the configurations of the new engine and the engine it is tested against
+    :param openings: the FEN strings of the positions games start from
+    :param games: the most games to play
+    :param processes: the number of worker processes, or None for one per CPU
+    :param hashSize: the transposition table size of each engine in megabytes
+    :param elo0: the Elo difference of H0
+    :param elo1: the Elo difference of H1
+    :param alpha: the chance of accepting H1 when H0 is true
+    :param beta: the chance of accepting H0 when H1 is true
+    :param sprt: stop when the SPRT accepts a hypothesis, rather than playing every game
+    :param outputPath: a JSONL file every game is written to, or None
+    :return: a dictionary of the wins, draws and losses of the first engine, the Elo difference and the SPRT result.
+    """
+    processes = processes or os.cpu_count()
+    lower, upper = sprtBounds(alpha, beta)
+    wins = draws = losses = 0
+    llr = 0.0
+    decision = None
+    output = open(outputPath, "w") if outputPath is not None else None
+    start = time.time()
+    pool = multiprocessing.Pool(processes, initWorker, (hashSize,))
+    try:
+        # games finish in any order, and each result is counted as soon as it is in
+        for game in pool.imap_unordered(playGame, gameTasks(engines, openings, games)):
+            if game["result"] == "1/2-1/2":
+                draws += 1
+            elif (game["result"] == "1-0") == (game["white"] == engines[0]["name"]):
+                wins += 1
+            else:
+                losses += 1
+            if output is not None:
+                output.write(json.dumps(game) + "\n")
+                output.flush()
+            elo, margin = eloDifference(wins, draws, losses)
+            llr = sprtLogLikelihoodRatio(wins, draws, losses, elo0, elo1)
+            print("games %d  +%d =%d -%d  elo %+.1f +/- %.1f  LLR %.2f (%.2f, %.2f)  %.1fs" % (
+                wins + draws + losses, wins, draws, losses, elo, margin, llr, lower, upper, time.time() - start))
+            if sprt and llr >= upper:
+                decision = "H1"
+                break
+            if sprt and llr <= lower:
+                decision = "H0"
+                break
+    except KeyboardInterrupt:
+        print("stopped")
+    finally:
+        # the games still being played are abandoned
+        pool.terminate()
+        pool.join()
+        if output is not None:
+            output.close()
+
+    elo, margin = eloDifference(wins, draws, losses)
+    if decision == "H1":
+        print("SPRT: H1 accepted --> %s is at least %g Elo stronger than %s" % (engines[0]["name"], elo1, engines[1]["name"]))
+    elif decision == "H0":
+        print("SPRT: H0 accepted --> %s is not %g Elo stronger than %s" % (engines[0]["name"], elo1, engines[1]["name"]))
+    elif sprt:
+        print("SPRT: no decision after %d games" % (wins + draws + losses))
+    return {"wins": wins, "draws": draws, "losses": losses, "elo": elo, "margin": margin, "llr": llr,
+            "bounds": (lower, upper), "decision": decision}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play two engine configurations against each other")
+    parser.add_argument("engine", type=parseEngine,
+                        help="the engine being tested, e.g. name=new,depth=4,time=0.5,nodes=20000,eval=material")
+    parser.add_argument("baseline", type=parseEngine, help="the engine it is tested against, in the same form")
+    parser.add_argument("--openings", help="EPD or FEN file of opening positions")
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES, help="most games to play")
+    parser.add_argument("--processes", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--hash", type=int, default=SmartMoveFinder.TT_SIZE_MB, help="megabytes of hash per engine")
+    parser.add_argument("--elo0", type=float, default=ELO0)
+    parser.add_argument("--elo1", type=float, default=ELO1)
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    parser.add_argument("--beta", type=float, default=BETA)
+    parser.add_argument("--no-sprt", action="store_true", help="play every game instead of stopping early")
+    parser.add_argument("--output", help="JSONL file to write every game to")
+    args = parser.parse_args()
+
+    if args.engine["name"] == args.baseline["name"]:
+        args.baseline["name"] += " (baseline)"
+    openings = DEFAULT_OPENINGS
+    if args.openings:
+        openings = []
+        for index, line in readRecords(args.openings):
+            # a bad opening is reported before any game starts rather than by a worker part way through the match
+            try:
+                openings.append(parseRecord(line)["fen"])
+                ChessEngine.GameState(openings[-1])
+            except ValueError as e:
+                raise SystemExit("%s: bad opening %d: %s" % (args.openings, index + 1, e))
+    runMatch([args.engine, args.baseline], openings, args.games, args.processes, args.hash, args.elo0, args.elo1,
+             args.alpha, args.beta, not args.no_sprt, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import argparse
+import json
+import time
+
+import ChessEngine
+
+# Perft counts every leaf of the move generation tree to a fixed depth. Comparing the counts with
+# the known values for standard test positions checks that getValidMoves/makeMove/undoMove are
+# correct, and the time taken measures how fast they are.
+
+# The engine only promotes to a queen, so the suite only uses positions and depths whose published
+# counts contain no promotions.
+PERFT_SUITE = [
+    {"name": "startpos", "fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     "counts": [20, 400, 8902, 197281, 4865609]},
+    {"name": "kiwipete", "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     "counts": [48, 2039, 97862]},
+    {"name": "position3", "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     "counts": [14, 191, 2812, 43238, 674624]},
+    {"name": "position4", "fen": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     "counts": [6]},
+    {"name": "position6", "fen": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     "counts": [46, 2079, 89890]},
+]
+
+# the position backends which can be compared --> see BitboardGameState
+BACKENDS = {"mailbox": ChessEngine.GameState, "bitboard": ChessEngine.BitboardGameState}
+# the backend the game and the search use
+DEFAULT_BACKEND = "bitboard"
+
+# A position is reported as a speed regression when its nodes/sec drops by more than this fraction
+REGRESSION_TOLERANCE = 0.1
+# and its time grows by more than this many seconds, so that timer jitter on the shallow depths is not reported
+MIN_TIME_DELTA = 0.1
+
+
+def perft(gs, depth, bulk=True):
+    """
+    Counts the leaf nodes of the move generation tree
+
+    :param gs: the game state
+    :param depth: how many plies to go down
+    :param bulk: count the moves at depth 1 instead of making each of them
+    :return: the number of leaf nodes.
+    """
+    moves = gs.getValidMoves()
+    if depth == 1 and bulk:
+        return len(moves)
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1, bulk)
+        gs.undoMove()
+    return nodes
+
+
+def divide(gs, depth, bulk=True):
+    """
+    Perft split by root move, to find which move a wrong count comes from
+
+    :param gs: the game state
+    :param depth: how many plies to go down, including the root move
+    :param bulk: count the moves at depth 1 instead of making each of them
+    :return: a dictionary of move notation to the number of leaf nodes below it.
+    """
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts[move.getChessNotation()] = perft(gs, depth - 1, bulk) if depth > 1 else 1
+        gs.undoMove()
+    return counts
+
+
+def timedPerft(fen, depth, backend=DEFAULT_BACKEND, bulk=True):
+    """
+    Runs perft on a position and times it
+
+    :return: a dictionary of the depth, node count, time and nodes/sec.
+    """
+    gs = BACKENDS[backend](fen)
+    start = time.perf_counter()
+    nodes = perft(gs, depth, bulk)
+    elapsed = time.perf_counter() - start
+    return {"depth": depth, "nodes": nodes, "time": elapsed, "nps": nodes / elapsed if elapsed > 0 else 0.0}
+
+
+def runSuite(maxDepth, backend=DEFAULT_BACKEND, bulk=True, suite=PERFT_SUITE):
+    """
+    Runs every position of the suite up to maxDepth and checks the counts
+
+    :return: a list of result dictionaries, one per position and depth.
+    """
+    results = []
+    for position in suite:
+        for depth, expected in enumerate(position["counts"][:maxDepth], 1):
+            result = timedPerft(position["fen"], depth, backend, bulk)
+            result.update({"name": position["name"], "fen": position["fen"], "expected": expected,
+                           "passed": result["nodes"] == expected})
+            results.append(result)
+            print("%-10s depth %d  nodes %10d  expected %10d  %s  %8.2fs  %10.0f nodes/sec" % (
+                position["name"], depth, result["nodes"], expected, "ok  " if result["passed"] else "FAIL",
+                result["time"], result["nps"]))
+    return results
+
+
+def findRegressions(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compares results with an earlier results file
+
+    :param results: the results of this run
+    :param baseline: the results dictionary loaded from an earlier run
+    :param tolerance: the fraction nodes/sec may drop by before it is reported, if the time also grows by MIN_TIME_DELTA
+    :return: a list of messages, one per regression.
+    """
+    earlier = {(result["fen"], result["depth"]): result for result in baseline["results"]}
+    messages = []
+    for result in results:
+        before = earlier.get((result["fen"], result["depth"]))
+        if before is None:
+            continue
+        if before["nodes"] != result["nodes"]:
+            messages.append("%s depth %d: node count changed from %d to %d" % (
+                result.get("name", result["fen"]), result["depth"], before["nodes"], result["nodes"]))
+        elif before["nps"] > 0 and result["nps"] < before["nps"] * (1 - tolerance) and \
+                result["time"] - before["time"] > MIN_TIME_DELTA:
+            messages.append("%s depth %d: %.0f nodes/sec, was %.0f" % (
+                result.get("name", result["fen"]), result["depth"], result["nps"], before["nps"]))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft move generation benchmark")
+    parser.add_argument("--fen", help="position to search instead of the start position")
+    parser.add_argument("--depth", type=int, default=4, help="depth to search to (maximum depth with --suite)")
+    parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    parser.add_argument("--suite", action="store_true", help="run the standard perft positions")
+    parser.add_argument("--no-bulk", action="store_true", help="make every leaf move instead of counting them")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results file from an earlier run to check for regressions")
+    args = parser.parse_args()
+    bulk = not args.no_bulk
+    fen = args.fen or PERFT_SUITE[0]["fen"]
+
+    if args.divide:
+        gs = BACKENDS[args.backend](fen)
+        counts = divide(gs, args.depth, bulk)
+        for notation in sorted(counts):
+            print(notation + ": " + str(counts[notation]))
+        print("\nMoves: %d\nNodes: %d" % (len(counts), sum(counts.values())))
+        return
+
+    if args.suite:
+        results = runSuite(args.depth, args.backend, bulk)
+    else:
+        result = timedPerft(fen, args.depth, args.backend, bulk)
+        result["fen"] = fen
+        results = [result]
+        print("depth %d  nodes %d  %.2fs  %.0f nodes/sec" % (result["depth"], result["nodes"], result["time"], result["nps"]))
+
+    totalNodes = sum(result["nodes"] for result in results)
+    totalTime = sum(result["time"] for result in results)
+    summary = {"backend": args.backend, "bulk": bulk, "results": results, "totalNodes": totalNodes,
+               "totalTime": totalTime, "nps": totalNodes / totalTime if totalTime > 0 else 0.0}
+    print("total %d nodes in %.2fs --> %.0f nodes/sec" % (totalNodes, totalTime, summary["nps"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = findRegressions(results, json.load(f))
+        for message in regressions:
+            print("REGRESSION: " + message)
+    if any(not result.get("passed", True) for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
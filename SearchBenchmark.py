@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import queue
+import random
+
+import SmartMoveFinder
+from Perft import BACKENDS, DEFAULT_BACKEND
+
+# Runs findBestMove on a fixed set of positions at fixed depths and records how much work it did,
+# so that a change to the search can be judged by comparing its results with a saved baseline.
+
+BENCHMARK_POSITIONS = [
+    {"name": "italian", "type": "middlegame",
+     "fen": "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"},
+    {"name": "queens-gambit", "type": "middlegame",
+     "fen": "r2q1rk1/pp2bppp/2n1bn2/3p4/3P4/2NBBN2/PP3PPP/R2Q1RK1 w - - 0 10"},
+    {"name": "scotch", "type": "middlegame",
+     "fen": "r1b1k2r/ppppnppp/2n2q2/2b5/3NP3/2P1B3/PP3PPP/RN1QKB1R w KQkq - 0 1"},
+    {"name": "kpk", "type": "endgame", "fen": "8/8/4k3/8/8/4K3/4P3/8 w - - 0 1"},
+    {"name": "krk", "type": "endgame", "fen": "8/5k2/8/8/8/8/3RK3/8 w - - 0 1"},
+    {"name": "back-rank-mate", "type": "tactical", "fen": "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"},
+    {"name": "scholars-mate", "type": "tactical",
+     "fen": "r1bqkbnr/pppp1ppp/2n5/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4"},
+]
+
+DEFAULT_DEPTH = 3
+# A position is reported as slower when its time grows by more than this fraction of the baseline
+TIME_TOLERANCE = 0.2
+# and by more than this many seconds, so that timer jitter on positions which take a few milliseconds is not reported
+MIN_TIME_DELTA = 0.1
+# random.shuffle in findBestMove is seeded so that equal moves are chosen the same way every run
+RANDOM_SEED = 0
+
+
+def benchmarkPosition(position, depth, backend=DEFAULT_BACKEND, threads=1):
+    """
+    Searches one position to a fixed depth with a fresh transposition table
+
+    :param position: a dictionary with the name and fen of the position
+    :param depth: the depth to search to
+    :param backend: the name of the position backend in Perft.BACKENDS
+    :param threads: the number of processes to search with
+    :return: a dictionary of the nodes, time, nodes/sec, effective branching factor and chosen move.
+    """
+    gs = BACKENDS[backend](position["fen"])
+    SmartMoveFinder.transpositionTable.clear()
+    random.seed(RANDOM_SEED)
+    returnQueue = queue.Queue()
+    SmartMoveFinder.findBestMoveParallel(gs, gs.getValidMoves(), returnQueue, threads, timeLimit=None, maxDepth=depth)
+    move = returnQueue.get()
+    info = SmartMoveFinder.lastSearchInfo
+    return {"name": position["name"], "type": position["type"], "fen": position["fen"], "depth": info["depth"],
+            "nodes": info["nodes"], "time": info["time"], "nps": info["nodes"] / info["time"] if info["time"] > 0 else 0.0,
+            "ebf": effectiveBranchingFactor(info["iterations"]),
+            "move": move.getChessNotation() if move is not None else None}
+
+
+def effectiveBranchingFactor(iterations):
+    """
+    How many times more nodes the last iteration of iterative deepening took than the one before
+
+    :param iterations: a list of (depth, total nodes searched once that depth was completed)
+    :return: the effective branching factor, or 0 if there were fewer than two iterations.
+    """
+    if len(iterations) < 2:
+        return 0.0
+    nodesPerIteration = [iterations[0][1]] + [iterations[i][1] - iterations[i - 1][1] for i in range(1, len(iterations))]
+    if nodesPerIteration[-2] == 0:
+        return 0.0
+    return nodesPerIteration[-1] / nodesPerIteration[-2]
+
+
+def runBenchmark(depth, backend=DEFAULT_BACKEND, positions=BENCHMARK_POSITIONS, threads=1):
+    """
+    Benchmarks every position and prints a line for each
+
+    :return: a list of result dictionaries.
+    """
+    results = []
+    for position in positions:
+        result = benchmarkPosition(position, depth, backend, threads)
+        results.append(result)
+        print("%-16s %-10s depth %d  %-5s  nodes %8d  %7.2fs  %8.0f nodes/sec  EBF %5.2f" % (
+            result["name"], result["type"], result["depth"], result["move"], result["nodes"], result["time"],
+            result["nps"], result["ebf"]))
+    return results
+
+
+def runSpeedupCurve(depth, maxThreads, backend=DEFAULT_BACKEND, positions=BENCHMARK_POSITIONS):
+    """
+    Runs the benchmark with 1 to maxThreads processes and works out the speedup of each over one
+    process, from the total time taken to reach the same depth. Every run uses the shared
+    transposition table so that only the number of processes changes.
+
+    :return: a list of dictionaries of the threads, time, nodes, nodes/sec and speedup of each run.
+    """
+    SmartMoveFinder.useSharedTranspositionTable()
+    curve = []
+    for threads in range(1, maxThreads + 1):
+        print("threads %d" % threads)
+        results = runBenchmark(depth, backend, positions, threads)
+        totalNodes = sum(result["nodes"] for result in results)
+        totalTime = sum(result["time"] for result in results)
+        curve.append({"threads": threads, "time": totalTime, "nodes": totalNodes,
+                      "nps": totalNodes / totalTime if totalTime > 0 else 0.0,
+                      "speedup": curve[0]["time"] / totalTime if curve and totalTime > 0 else 1.0, "results": results})
+    print("threads      time       nodes   nodes/sec  speedup")
+    for point in curve:
+        print("%7d  %7.2fs  %10d  %10.0f  %6.2fx" % (
+            point["threads"], point["time"], point["nodes"], point["nps"], point["speedup"]))
+    return curve
+
+
+def compareWithBaseline(results, baseline, tolerance=TIME_TOLERANCE):
+    """
+    Finds the positions which are slower or choose a different move than in the baseline
+
+    :param results: the results of this run
+    :param baseline: the results dictionary loaded from a baseline file
+    :param tolerance: the fraction the time may grow by before it is reported, if it also grows by MIN_TIME_DELTA
+    :return: a list of messages, one per difference.
+    """
+    earlier = {(result["fen"], result["depth"]): result for result in baseline["results"]}
+    messages = []
+    for result in results:
+        before = earlier.get((result["fen"], result["depth"]))
+        if before is None:
+            continue
+        if result["move"] != before["move"]:
+            messages.append("%s: chose %s, baseline chose %s" % (result["name"], result["move"], before["move"]))
+        if result["time"] - before["time"] > max(before["time"] * tolerance, MIN_TIME_DELTA):
+            messages.append("%s: %.2fs, baseline %.2fs (%d nodes, baseline %d)" % (
+                result["name"], result["time"], before["time"], result["nodes"], before["nodes"]))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search benchmark for SmartMoveFinder")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results file to compare this run with")
+    parser.add_argument("--tolerance", type=float, default=TIME_TOLERANCE,
+                        help="fraction the time of a position may grow by before it is reported")
+    parser.add_argument("--threads", type=int,
+                        help="measure the Lazy SMP speedup of 1 up to this many processes instead")
+    args = parser.parse_args()
+
+    if args.threads:
+        curve = runSpeedupCurve(args.depth, args.threads, args.backend)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"backend": args.backend, "depth": args.depth, "cpus": os.cpu_count(), "curve": curve}, f, indent=2)
+        SmartMoveFinder.transpositionTable.close()
+        return
+
+    results = runBenchmark(args.depth, args.backend)
+    totalNodes = sum(result["nodes"] for result in results)
+    totalTime = sum(result["time"] for result in results)
+    summary = {"backend": args.backend, "depth": args.depth, "results": results, "totalNodes": totalNodes,
+               "totalTime": totalTime, "nps": totalNodes / totalTime if totalTime > 0 else 0.0}
+    print("total %d nodes in %.2fs --> %.0f nodes/sec" % (totalNodes, totalTime, summary["nps"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            messages = compareWithBaseline(results, json.load(f), args.tolerance)
+        for message in messages:
+            print("REGRESSION: " + message)
+        if messages:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,20 @@
+import multiprocessing
+import queue
 import random
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import ChessEngine
+import PolyglotBook
+import Tablebase
 
 # This is a dictionary that assigns a value to each piece. The values are used to calculate the
 # material score of the board.
 pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1}
+# Piece values used when working out exchanges. The king is worth more than everything else so
+# that it only ever joins an exchange as the last capture.
+SEE_PIECE_VALUES = dict(pieceScore, K=100)
 
 
 # `knightScores` is a matrix that assigns a score to each square on the board. The score is based on
@@ -80,6 +92,56 @@ blackPawnScores = [[0, 0, 0, 0, 0, 0, 0, 0],
 # material score of the board.
 piecePositionScores = {"N": knightScores, "Q":queenScores, "B": bishopScores, "R": rookScores, "bp": blackPawnScores, "wp": whitePawnScores}
 
+# Piece-square scores are weighted by this much relative to material in scoreBoard
+POSITION_WEIGHT = .1
+
+
+def buildEvaluationTables():
+    """
+    Turns pieceScore and piecePositionScores into the per-piece values which GameState keeps running
+    totals of. Values are positive for white pieces and negative for black pieces.
+
+    :return: a tuple of (materialValues, positionValues) where materialValues[piece] is a number and
+    positionValues[piece] is a list of 64 numbers indexed by row * 8 + col
+    """
+    materialValues = {}
+    positionValues = {}
+    for colour, sign in (("w", 1), ("b", -1)):
+        for piece in "pRNBQK":
+            materialValues[colour + piece] = sign * pieceScore[piece]
+            if piece == "K":
+                positionValues[colour + piece] = [0] * 64
+            else:
+                table = piecePositionScores[colour + piece] if piece == "p" else piecePositionScores[piece]
+                positionValues[colour + piece] = [sign * table[sq // 8][sq % 8] for sq in range(64)]
+    return materialValues, positionValues
+
+
+materialValues, positionValues = buildEvaluationTables()
+
+# the tables above, which useEvaluation goes back to for anything it is not given
+DEFAULT_PIECE_SCORE = pieceScore
+DEFAULT_PIECE_POSITION_SCORES = piecePositionScores
+DEFAULT_POSITION_WEIGHT = POSITION_WEIGHT
+
+
+def useEvaluation(pieceValues=None, positionScores=None, positionWeight=None):
+    """
+    Makes the search evaluate positions with other tables, for example so that two versions of the
+    evaluation can play each other. Anything not given is taken from the default tables.
+
+    :param pieceValues: a dictionary of the value of each piece, like pieceScore
+    :param positionScores: a dictionary of 8x8 square scores for each piece, like piecePositionScores
+    :param positionWeight: how much the square scores are weighted relative to material
+    """
+    global pieceScore, SEE_PIECE_VALUES, piecePositionScores, POSITION_WEIGHT, materialValues, positionValues
+    pieceScore = DEFAULT_PIECE_SCORE if pieceValues is None else dict(DEFAULT_PIECE_SCORE, **pieceValues)
+    SEE_PIECE_VALUES = dict(pieceScore, K=100)
+    piecePositionScores = DEFAULT_PIECE_POSITION_SCORES if positionScores is None else \
+        dict(DEFAULT_PIECE_POSITION_SCORES, **positionScores)
+    POSITION_WEIGHT = DEFAULT_POSITION_WEIGHT if positionWeight is None else positionWeight
+    materialValues, positionValues = buildEvaluationTables()
+
 
 
 
@@ -89,6 +151,351 @@ piecePositionScores = {"N": knightScores, "Q":queenScores, "B": bishopScores, "R
 CHECKMATE = 1000
 STALEMATE = 0
 DEPTH = 3
+# Mate scores count the plies to the mate --> being mated at ply p of the search scores -(CHECKMATE - p),
+# so a quicker mate scores higher. No evaluation comes near this threshold, so any score at least this
+# far from zero is a mate found by the search or in the tablebases.
+MATE_SCORE_THRESHOLD = CHECKMATE // 2
+
+# findBestMove deepens one ply at a time until one of these budgets runs out
+TIME_LIMIT = 3.0  # seconds per move
+MAX_DEPTH = 20
+# how many nodes are searched between checks of the clock
+NODES_PER_TIME_CHECK = 512
+# number of processes findBestMoveParallel searches with (Lazy SMP)
+SEARCH_THREADS = 1
+# seconds between checks that the Lazy SMP helpers are still alive while waiting for their results,
+# and the longest they are waited for once the main search has finished
+HELPER_POLL_INTERVAL = 0.1
+HELPER_STOP_TIMEOUT = 5.0
+# seconds between checks for a ponderhit once a ponder search has finished early
+PONDER_POLL_INTERVAL = 0.01
+# seconds a ponder search carries on for after a ponderhit, however long it has already been searching
+PONDERHIT_MIN_TIME = 0.1
+
+# depth of the iteration currently being searched --> the root of findMoveNegaMaxAlphaBeta
+searchDepth = DEPTH
+# wall-clock time and node count at which the current search gives up
+searchDeadline = None
+searchNodeLimit = None
+# function called with the clock checks which returns True when the search has been cancelled
+searchStopCheck = None
+# details of the last completed iteration of findBestMove
+lastSearchInfo = {}
+# endgame tablebases probed at the root and inside the search, see useTablebases
+tablebases = None
+
+# Move ordering. Moves which are likely to cause a cutoff are searched first:
+# 1. the best move stored in the transposition table
+# 2. captures, most valuable victim first and then least valuable attacker (MVV-LVA)
+# 3. pawn promotions
+# 4. killer moves --> quiet moves which caused a cutoff at the same ply in another branch
+# 5. the remaining quiet moves by their history score --> how often they have caused cutoffs
+TT_MOVE_SCORE = 10000000
+CAPTURE_SCORE = 1000000
+PROMOTION_SCORE = 900000
+KILLER_SCORE = 800000
+MAX_PLY = 64
+# two killer moveIDs per ply
+killerMoves = [[None, None] for ply in range(MAX_PLY)]
+# butterfly history table indexed by colour (0 = white, 1 = black) and then moveID (fromSquare * 64 + toSquare)
+historyScores = [[0] * (64 * 64) for colour in range(2)]
+# nodes which produced a beta cutoff, and how many of those cut off on the first move searched
+orderingStats = {"cutoffs": 0, "firstMoveCutoffs": 0}
+
+
+class SearchAborted(Exception):
+    """
+    Raised inside the search when its time or node budget has been used up
+    """
+
+# Bound types stored in the transposition table. An EXACT score is the true value of the position,
+# a LOWER_BOUND came from a beta cutoff and an UPPER_BOUND from a search which failed low.
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Memory budget for the transposition table in megabytes
+TT_SIZE_MB = 16
+# Approximate memory used by one entry: five list slots plus the int objects they point to
+TT_ENTRY_BYTES = 64
+
+
+class TranspositionTable():
+    """
+    Fixed-size cache of search results keyed by the Zobrist key of the position.
+    Each bucket holds two entries: the first is only replaced by a search at least as deep
+    (depth-preferred) and the second is always replaced, so deep results survive while recent
+    shallow ones are still kept.
+    """
+
+    def __init__(self, sizeMB=TT_SIZE_MB):
+        """
+        :param sizeMB: the memory budget of the table in megabytes
+        """
+        self.numBuckets = max(1, sizeMB * 1024 * 1024 // (TT_ENTRY_BYTES * 2))
+        size = self.numBuckets * 2
+        # parallel lists are used rather than one object per entry to keep the table compact
+        self.keys = [None] * size
+        self.depths = [0] * size
+        self.scores = [0] * size
+        self.flags = [EXACT] * size
+        self.moves = [None] * size
+        self.filled = 0
+        self.resetStats()
+
+    def resetStats(self):
+        """
+        Clears the probe counters without clearing the stored entries
+        """
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def clear(self):
+        """
+        Removes every entry from the table
+        """
+        size = self.numBuckets * 2
+        self.keys = [None] * size
+        self.moves = [None] * size
+        self.filled = 0
+        self.resetStats()
+
+    def probe(self, key):
+        """
+        Looks up a position in the table.
+
+        :param key: the Zobrist key of the position
+        :return: a tuple of (depth, score, flag, moveID), or None if the position is not stored
+        """
+        self.probes += 1
+        slot = (key % self.numBuckets) * 2
+        keys = self.keys
+        for i in (slot, slot + 1):
+            if keys[i] == key:
+                self.hits += 1
+                return self.depths[i], self.scores[i], self.flags[i], self.moves[i]
+        # the bucket is holding other positions which share its index
+        if keys[slot] is not None or keys[slot + 1] is not None:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, flag, moveID):
+        """
+        Stores the result of a search.
+
+        :param key: the Zobrist key of the position
+        :param depth: the depth the position was searched to
+        :param score: the score from the point of view of the side to move
+        :param flag: EXACT, LOWER_BOUND or UPPER_BOUND
+        :param moveID: the moveID of the best move found, or None
+        """
+        self.stores += 1
+        slot = (key % self.numBuckets) * 2
+        keys = self.keys
+        if keys[slot] == key or keys[slot] is None or depth >= self.depths[slot]:
+            if keys[slot] is not None and keys[slot] != key:
+                # the entry being pushed out of the depth-preferred slot moves to the always-replace slot
+                self.writeEntry(slot + 1, keys[slot], self.depths[slot], self.scores[slot], self.flags[slot], self.moves[slot])
+            elif keys[slot + 1] == key:
+                keys[slot + 1] = None
+                self.filled -= 1
+            i = slot
+        else:
+            i = slot + 1
+        if moveID is None and keys[i] == key:
+            moveID = self.moves[i]  # keep the best move from an earlier search of the same position
+        self.writeEntry(i, key, depth, score, flag, moveID)
+
+    def writeEntry(self, i, key, depth, score, flag, moveID):
+        if self.keys[i] is None:
+            self.filled += 1
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.scores[i] = score
+        self.flags[i] = flag
+        self.moves[i] = moveID
+
+    def stats(self):
+        """
+        Returns the usage statistics of the table so that it can be sized for a given machine
+        """
+        size = self.numBuckets * 2
+        return {"entries": size, "filled": self.filled, "fillLevel": self.filled / size,
+                "probes": self.probes, "hits": self.hits, "hitRate": self.hits / self.probes if self.probes else 0.0,
+                "collisions": self.collisions,
+                "collisionRate": self.collisions / self.probes if self.probes else 0.0, "stores": self.stores}
+
+
+transpositionTable = TranspositionTable()
+
+# Layout of an entry of the shared table: three 64-bit words --> the key xor-ed with the other two
+# words, the packed data word and the bits of the (float) score. The data word holds the moveID + 1
+# (0 for no move) in bits 0-12, a bit which is always set so that a used entry is never 0, the flag
+# in bits 14-15 and the depth from bit 16.
+SHARED_ENTRY_BYTES = 24
+SHARED_MOVE_MASK = 0x1FFF
+SHARED_USED_BIT = 1 << 13
+SHARED_FLAG_SHIFT = 14
+SHARED_DEPTH_SHIFT = 16
+_scoreStruct = struct.Struct("<d")
+_wordStruct = struct.Struct("<Q")
+
+
+class SharedTranspositionTable():
+    """
+    Transposition table kept in shared memory so that every process of a parallel search uses the
+    same one. It has the buckets and replacement scheme of TranspositionTable but takes no locks.
+    Each entry stores its key xor-ed with its data, so an entry which another process was writing at
+    the same time fails the key check and is treated as missing instead of giving a wrong result.
+    """
+
+    def __init__(self, sizeMB=TT_SIZE_MB):
+        """
+        :param sizeMB: the memory budget of the table in megabytes
+        """
+        self.numBuckets = max(1, sizeMB * 1024 * 1024 // (SHARED_ENTRY_BYTES * 2))
+        self.sharedMemory = shared_memory.SharedMemory(create=True, size=self.numBuckets * 2 * SHARED_ENTRY_BYTES)
+        self.owner = True
+        self.words = self.sharedMemory.buf.cast("Q")
+        self.resetStats()
+
+    def __getstate__(self):
+        # a process started with spawn attaches to the table by name instead of copying it
+        return {"name": self.sharedMemory.name, "numBuckets": self.numBuckets}
+
+    def __setstate__(self, state):
+        self.numBuckets = state["numBuckets"]
+        self.sharedMemory = shared_memory.SharedMemory(name=state["name"])
+        # only the process which created the table removes it
+        resource_tracker.unregister(self.sharedMemory._name, "shared_memory")
+        self.owner = False
+        self.words = self.sharedMemory.buf.cast("Q")
+        self.resetStats()
+
+    def resetStats(self):
+        """
+        Clears the probe counters of this process without clearing the stored entries
+        """
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def clear(self):
+        """
+        Removes every entry from the table
+        """
+        self.sharedMemory.buf[:] = bytes(self.sharedMemory.size)
+        self.resetStats()
+
+    def close(self):
+        """
+        Detaches from the shared memory, and frees it if this process created the table
+        """
+        self.words.release()
+        self.sharedMemory.close()
+        if self.owner:
+            self.sharedMemory.unlink()
+
+    def readEntry(self, i):
+        """
+        :return: a tuple of (key, data, scoreBits) of entry i, with a key of None if the entry is empty or torn
+        """
+        words = self.words
+        j = i * 3
+        data = words[j + 1]
+        scoreBits = words[j + 2]
+        key = words[j] ^ data ^ scoreBits
+        if not data or (key % self.numBuckets) * 2 != i - i % 2:
+            return None, 0, 0
+        return key, data, scoreBits
+
+    def writeEntry(self, i, key, data, scoreBits):
+        words = self.words
+        j = i * 3
+        words[j + 1] = data
+        words[j + 2] = scoreBits
+        words[j] = key ^ data ^ scoreBits
+
+    def probe(self, key):
+        """
+        Looks up a position in the table.
+
+        :param key: the Zobrist key of the position
+        :return: a tuple of (depth, score, flag, moveID), or None if the position is not stored
+        """
+        self.probes += 1
+        slot = (key % self.numBuckets) * 2
+        words = self.words
+        occupied = False
+        for i in (slot, slot + 1):
+            j = i * 3
+            data = words[j + 1]
+            if not data:
+                continue
+            scoreBits = words[j + 2]
+            if words[j] ^ data ^ scoreBits == key:
+                self.hits += 1
+                move = data & SHARED_MOVE_MASK
+                return (data >> SHARED_DEPTH_SHIFT, _scoreStruct.unpack(_wordStruct.pack(scoreBits))[0],
+                        (data >> SHARED_FLAG_SHIFT) & 3, move - 1 if move else None)
+            occupied = True
+        if occupied:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, flag, moveID):
+        """
+        Stores the result of a search.
+
+        :param key: the Zobrist key of the position
+        :param depth: the depth the position was searched to
+        :param score: the score from the point of view of the side to move
+        :param flag: EXACT, LOWER_BOUND or UPPER_BOUND
+        :param moveID: the moveID of the best move found, or None
+        """
+        self.stores += 1
+        slot = (key % self.numBuckets) * 2
+        firstKey, firstData, firstScoreBits = self.readEntry(slot)
+        secondKey, secondData, secondScoreBits = self.readEntry(slot + 1)
+        if firstKey == key or firstKey is None or depth >= firstData >> SHARED_DEPTH_SHIFT:
+            if firstKey is not None and firstKey != key:
+                # the entry being pushed out of the depth-preferred slot moves to the always-replace slot
+                self.writeEntry(slot + 1, firstKey, firstData, firstScoreBits)
+            elif secondKey == key:
+                self.writeEntry(slot + 1, 0, 0, 0)
+            i, oldKey, oldData = slot, firstKey, firstData
+        else:
+            i, oldKey, oldData = slot + 1, secondKey, secondData
+        if moveID is None and oldKey == key and oldData & SHARED_MOVE_MASK:
+            moveID = (oldData & SHARED_MOVE_MASK) - 1  # keep the best move from an earlier search of the same position
+        data = (depth << SHARED_DEPTH_SHIFT) | (flag << SHARED_FLAG_SHIFT) | SHARED_USED_BIT | \
+            (moveID + 1 if moveID is not None else 0)
+        self.writeEntry(i, key, data, _wordStruct.unpack(_scoreStruct.pack(score))[0])
+
+    def stats(self):
+        """
+        Returns the usage statistics of the table. The probe counters only cover this process.
+        """
+        size = self.numBuckets * 2
+        filled = sum(1 for data in self.words[1::3] if data)
+        return {"entries": size, "filled": filled, "fillLevel": filled / size,
+                "probes": self.probes, "hits": self.hits, "hitRate": self.hits / self.probes if self.probes else 0.0,
+                "collisions": self.collisions,
+                "collisionRate": self.collisions / self.probes if self.probes else 0.0, "stores": self.stores}
+
+
+def useSharedTranspositionTable(sizeMB=TT_SIZE_MB):
+    """
+    Replaces the transposition table with a SharedTranspositionTable, which is then kept for later
+    searches so that it stays warm from one move to the next like the local one.
+    """
+    global transpositionTable
+    if not isinstance(transpositionTable, SharedTranspositionTable):
+        transpositionTable = SharedTranspositionTable(sizeMB)
+    return transpositionTable
 
 
 
@@ -144,21 +551,473 @@ def findBestMoveMinMaxNoRecursion(gs, validMoves):
         gs.undoMove()
     return bestPlayerMove
 
-def findBestMove(gs, validMoves, returnQueue):
+def findBestMove(gs, validMoves, returnQueue, timeLimit=TIME_LIMIT, nodeLimit=None, maxDepth=MAX_DEPTH, stopCheck=None,
+                 startDepth=1, onIteration=None):
     """
     This function takes in a game state, a list of valid moves, and a queue. 
     It then finds the best move in the list of valid moves and puts it in the queue.
+    The search is repeated one ply deeper each time until the time or node budget runs out. The move
+    from the last completed iteration is kept and is searched first in the next one.
     
     :param gs: the game state
     :param validMoves: a list of valid moves
     :param returnQueue: a multiprocessing.Queue object that the function will put its answer into
+    :param timeLimit: the number of seconds the search may take, or None for no limit
+    :param nodeLimit: the number of nodes the search may visit, or None for no limit
+    :param maxDepth: the deepest iteration to search
+    :param stopCheck: a function which returns True when the search should stop early, or None
+    :param startDepth: the depth of the first iteration
+    :param onIteration: a function called with lastSearchInfo after each completed iteration, or None
     """
-    global nextMove, counter
-    nextMove = None
+    global nextMove, counter, searchDepth, searchDeadline, searchNodeLimit, searchStopCheck, lastSearchInfo
     random.shuffle(validMoves)
     counter = 0
-    findMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    returnQueue.put(nextMove)
+    if tablebases is not None:
+        # a position in the endgame tablebases is looked up instead of searched
+        move, score = findTablebaseMove(gs, validMoves)
+        if move is not None:
+            lastSearchInfo = {"depth": 0, "score": score, "nodes": 0, "time": 0.0, "move": move, "iterations": []}
+            if onIteration is not None:
+                onIteration(lastSearchInfo)
+            returnQueue.put(move)
+            return
+    resetMoveOrdering()
+    useIncrementalEvaluation(gs)
+    startTime = time.time()
+    searchDeadline = startTime + timeLimit if timeLimit is not None else None
+    searchNodeLimit = nodeLimit
+    searchStopCheck = stopCheck
+    lastSearchInfo = {"depth": 0, "score": 0, "nodes": 0, "time": 0.0, "move": None, "iterations": []}
+    rootMoves = list(validMoves)
+    movesMade = len(gs.moveLog)
+    bestMove = None
+    for depth in range(startDepth, maxDepth + 1):
+        searchDepth = depth
+        nextMove = None
+        try:
+            score = findMoveNegaMaxAlphaBeta(gs, rootMoves, depth, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
+        except SearchAborted:
+            # take back the moves which were on the board when the budget ran out
+            while len(gs.moveLog) > movesMade:
+                gs.undoMove()
+            if bestMove is None and rootMoves:
+                # no iteration finished in time --> the best move of the unfinished one, or any legal move
+                bestMove = nextMove if nextMove is not None else rootMoves[0]
+                lastSearchInfo = dict(lastSearchInfo, nodes=counter, time=time.time() - startTime, move=bestMove)
+            break
+        if nextMove is None:
+            break  # no legal moves
+        bestMove = nextMove
+        # the best move of this iteration is searched first in the next one
+        rootMoves.remove(bestMove)
+        rootMoves.insert(0, bestMove)
+        lastSearchInfo = {"depth": depth, "score": score, "nodes": counter, "time": time.time() - startTime,
+                          "move": bestMove, "iterations": lastSearchInfo["iterations"] + [(depth, counter)]}
+        if onIteration is not None:
+            onIteration(lastSearchInfo)
+        if abs(score) >= MATE_SCORE_THRESHOLD:
+            break  # a forced mate has been found, deeper searches cannot improve on it
+    searchDeadline = None
+    searchNodeLimit = None
+    searchStopCheck = None
+    returnQueue.put(bestMove)
+
+
+def useTablebases(directory=Tablebase.TABLEBASE_DIR):
+    """
+    Loads the endgame tablebases in a directory, so that the search looks up positions with few
+    enough pieces instead of searching them
+    """
+    global tablebases
+    if tablebases is not None:
+        tablebases.close()
+    tablebases = Tablebase.Tablebases(directory)
+
+
+def tablebaseScore(result):
+    """
+    Converts a tablebase result into a search score from the point of view of the side to move.
+    Wins and losses are mate scores counting the plies to mate from this position, so shorter wins
+    and longer losses score higher.
+
+    :param result: a (result, dtm) tuple from Tablebases.probe
+    """
+    if result[0] > 0:
+        return CHECKMATE - result[1]
+    if result[0] < 0:
+        return -CHECKMATE + result[1]
+    return STALEMATE
+
+
+def findTablebaseMove(gs, validMoves):
+    """
+    Picks the move with the best tablebase result --> the fastest win, otherwise a draw, otherwise
+    the slowest loss
+
+    :param gs: the game state
+    :param validMoves: the valid moves of the position
+    :return: a tuple of (move, score), or (None, 0) if the position or one of its moves is not in the tablebases
+    """
+    if not validMoves or tablebases.probe(gs) is None:
+        return None, 0
+    bestMove = None
+    bestScore = -CHECKMATE - 1
+    for move in validMoves:
+        gs.makeMove(move)
+        result = tablebases.probe(gs)
+        gs.undoMove()
+        if result is None:
+            return None, 0
+        score = -mateScoreFromTable(tablebaseScore(result), 1)
+        if score > bestScore:
+            bestScore = score
+            bestMove = move
+    return bestMove, bestScore
+
+
+def findBestMoveParallel(gs, validMoves, returnQueue, threads=SEARCH_THREADS, timeLimit=TIME_LIMIT, nodeLimit=None,
+                         maxDepth=MAX_DEPTH, stopCheck=None, onIteration=None):
+    """
+    Lazy SMP search. threads - 1 helper processes search the same position as this process, each with
+    its own move order and every other one starting a ply deeper, and they share their results through
+    a SharedTranspositionTable. When this process finishes, the helpers are stopped and the move of the
+    deepest completed iteration of any process is played.
+    lastSearchInfo["nodes"] counts the nodes of every process.
+
+    :param gs: the game state
+    :param validMoves: a list of valid moves
+    :param returnQueue: a queue the best move is put into
+    :param threads: the number of processes to search with, 1 searches in this process only
+    :param timeLimit: the number of seconds the search may take, or None for no limit
+    :param nodeLimit: the number of nodes each process may visit, or None for no limit
+    :param maxDepth: the deepest iteration to search
+    :param stopCheck: a function which returns True when the search should stop early, or None
+    :param onIteration: a function called with lastSearchInfo after each iteration this process completes, or None
+    """
+    global lastSearchInfo
+    if threads <= 1:
+        findBestMove(gs, validMoves, returnQueue, timeLimit, nodeLimit, maxDepth, stopCheck, onIteration=onIteration)
+        return
+    table = useSharedTranspositionTable()
+    stopEvent = multiprocessing.Event()
+    resultQueue = multiprocessing.Queue()
+    helpers = [multiprocessing.Process(target=lazySmpHelper, daemon=True,
+                                       args=(gs, helper, table, timeLimit, nodeLimit, maxDepth, stopEvent, resultQueue))
+               for helper in range(1, threads)]
+    for helper in helpers:
+        helper.start()
+    mainQueue = queue.Queue()
+    try:
+        findBestMove(gs, validMoves, mainQueue, timeLimit, nodeLimit, maxDepth, stopCheck, onIteration=onIteration)
+    finally:
+        stopEvent.set()
+    bestMove = mainQueue.get()
+    info = dict(lastSearchInfo, nodes=counter, threads=threads)
+    # a helper which has died (killed, or out of memory) never answers, and one which does not stop is
+    # not waited for, so the move is then chosen from the results which did arrive
+    deadline = time.time() + HELPER_STOP_TIMEOUT
+    received = 0
+    while received < len(helpers):
+        try:
+            depth, score, moveID, nodes = resultQueue.get(timeout=HELPER_POLL_INTERVAL)
+        except queue.Empty:
+            if time.time() > deadline or not any(helper.is_alive() for helper in helpers):
+                break
+            continue
+        received += 1
+        info["nodes"] += nodes
+        if depth > info["depth"] and moveID is not None:
+            for move in validMoves:
+                if move.moveID == moveID:
+                    bestMove = move
+                    info.update(depth=depth, score=score, move=move)
+    for helper in helpers:
+        helper.join(HELPER_POLL_INTERVAL)
+        if helper.is_alive():
+            helper.terminate()
+            helper.join()
+    lastSearchInfo = info
+    returnQueue.put(bestMove)
+
+
+def lazySmpHelper(gs, helper, table, timeLimit, nodeLimit, maxDepth, stopEvent, resultQueue):
+    """
+    Runs in a helper process of findBestMoveParallel until its search ends or stopEvent is set, then
+    puts (depth, score, moveID, nodes) of its deepest completed iteration on resultQueue.
+
+    :param gs: the game state
+    :param helper: the number of this helper, from 1
+    :param table: the SharedTranspositionTable of the search
+    :param stopEvent: a multiprocessing.Event set by the main process when it has finished
+    :param resultQueue: a multiprocessing.Queue the result is put into
+    """
+    global transpositionTable
+    transpositionTable = table
+    # helpers started with fork share the random state of the main process, so each shuffles the moves differently
+    random.seed(random.getrandbits(64) + helper)
+    returnQueue = queue.Queue()
+    findBestMove(gs, gs.getValidMoves(), returnQueue, timeLimit, nodeLimit, maxDepth, stopEvent.is_set,
+                 startDepth=1 + helper % 2)
+    move = returnQueue.get()
+    resultQueue.put((lastSearchInfo["depth"], lastSearchInfo["score"], move.moveID if move is not None else None, counter))
+
+
+def resetMoveOrdering():
+    """
+    Clears the killer moves, history scores and cutoff statistics before a new search
+    """
+    global killerMoves, historyScores, orderingStats
+    killerMoves = [[None, None] for ply in range(MAX_PLY)]
+    historyScores = [[0] * (64 * 64) for colour in range(2)]
+    orderingStats = {"cutoffs": 0, "firstMoveCutoffs": 0}
+
+
+def getOrderingStats():
+    """
+    Returns the cutoff statistics of the last search. firstMoveCutoffRate is the fraction of
+    cutoffs which happened on the first move searched --> the closer to 1, the better the ordering.
+    """
+    cutoffs = orderingStats["cutoffs"]
+    return {"cutoffs": cutoffs, "firstMoveCutoffs": orderingStats["firstMoveCutoffs"],
+            "firstMoveCutoffRate": orderingStats["firstMoveCutoffs"] / cutoffs if cutoffs else 0.0}
+
+
+def orderMoves(gs, moves, ply, ttMoveID):
+    """
+    Sorts the moves so that those most likely to cause a cutoff are searched first
+
+    :param gs: the game state
+    :param moves: the moves to order
+    :param ply: the distance from the root of the search
+    :param ttMoveID: the moveID of the best move stored in the transposition table, or None
+    :return: a new list of the moves in the order they should be searched
+    """
+    killers = killerMoves[ply] if ply < MAX_PLY else (None, None)
+    history = historyScores[0 if gs.whiteToMove else 1]
+    scores = {}
+    for move in moves:
+        if move.moveID == ttMoveID:
+            score = TT_MOVE_SCORE
+        elif move.isCapture:
+            score = CAPTURE_SCORE + 10 * pieceScore[move.pieceCaptured[1]] - pieceScore[move.pieceMoved[1]]
+        elif move.isPawnPromotion:
+            score = PROMOTION_SCORE
+        elif move.moveID == killers[0]:
+            score = KILLER_SCORE
+        elif move.moveID == killers[1]:
+            score = KILLER_SCORE - 1
+        else:
+            score = history[move.moveID]
+        scores[move.moveID] = score
+    return sorted(moves, key=lambda move: scores[move.moveID], reverse=True)
+
+
+def recordCutoff(gs, move, depth, ply):
+    """
+    Remembers a quiet move which caused a beta cutoff as a killer move and in the history table
+    """
+    if move.isCapture or move.isPawnPromotion:
+        return  # these are already searched early
+    if ply < MAX_PLY:
+        killers = killerMoves[ply]
+        if killers[0] != move.moveID:
+            killers[1] = killers[0]
+            killers[0] = move.moveID
+    history = historyScores[0 if gs.whiteToMove else 1]
+    history[move.moveID] += depth * depth
+
+
+def checkSearchBudget():
+    """
+    Raises SearchAborted once the search has used up its time or node budget, or has been cancelled
+    """
+    if searchNodeLimit is not None and counter >= searchNodeLimit:
+        raise SearchAborted()
+    if counter % NODES_PER_TIME_CHECK == 0:
+        if searchDeadline is not None and time.time() >= searchDeadline:
+            raise SearchAborted()
+        if searchStopCheck is not None and searchStopCheck():
+            raise SearchAborted()
+
+
+def engineWorker(requestQueue, responseQueue, cancelledRequest, gameStateClass=ChessEngine.BitboardGameState, threads=SEARCH_THREADS,
+                 ponderHit=None, bookPath=None, tablebasePath=None):
+    """
+    Runs in a long-lived process and searches positions on request, so that process start-up is
+    paid once and the transposition table stays warm from one move to the next.
+
+    Requests are tuples put on requestQueue:
+    ("search", requestID, moveIDs) --> search the position reached by playing moveIDs from the start
+    ("ponder", requestID, moveIDs) --> search while the opponent thinks about the position reached by
+    moveIDs, see ponder
+    ("newgame",) --> forget the previous game, including the transposition table
+    ("quit",) --> end the process
+    Each search answers with ("bestmove", requestID, moveID) on responseQueue, where moveID is None
+    if no move was found or moveIDs could not be played. A search stops early once cancelledRequest.value reaches its requestID.
+
+    :param requestQueue: a multiprocessing.Queue of requests
+    :param responseQueue: a multiprocessing.Queue the answers are put into
+    :param cancelledRequest: a multiprocessing.Value holding the highest requestID which has been cancelled
+    :param gameStateClass: the position backend to search with
+    :param threads: the number of processes each search uses, see findBestMoveParallel
+    :param ponderHit: a multiprocessing.Value holding the highest ponder requestID whose expected
+    reply was played, needed for ponder requests
+    :param bookPath: the path of a Polyglot opening book to play from before searching, or None
+    :param tablebasePath: the directory of the endgame tablebases, or None
+    """
+    gs = gameStateClass()
+    book = PolyglotBook.PolyglotBook(bookPath) if bookPath is not None else None
+    if tablebasePath is not None:
+        useTablebases(tablebasePath)
+    while True:
+        request = requestQueue.get()
+        if request[0] == "quit":
+            if isinstance(transpositionTable, SharedTranspositionTable):
+                transpositionTable.close()
+            if book is not None:
+                book.close()
+            if tablebases is not None:
+                tablebases.close()
+            break
+        elif request[0] == "newgame":
+            gs = gameStateClass()
+            transpositionTable.clear()
+        elif request[0] == "search":
+            requestID, moveIDs = request[1], request[2]
+            if cancelledRequest.value >= requestID:
+                responseQueue.put(("bestmove", requestID, None))
+                continue
+            try:
+                syncGameState(gs, moveIDs)
+            except ValueError:
+                # moveIDs which cannot be played are answered with no move, and the worker carries on
+                responseQueue.put(("bestmove", requestID, None))
+                continue
+            validMoves = gs.getValidMoves()
+            move = book.chooseMove(gs, validMoves) if book is not None else None
+            if move is None:
+                returnQueue = queue.Queue()
+                findBestMoveParallel(gs, validMoves, returnQueue, threads,
+                                     stopCheck=lambda: cancelledRequest.value >= requestID)
+                move = returnQueue.get()
+            responseQueue.put(("bestmove", requestID, move.moveID if move is not None else None))
+        elif request[0] == "ponder":
+            requestID, moveIDs = request[1], request[2]
+            if cancelledRequest.value >= requestID:
+                responseQueue.put(("bestmove", requestID, None))
+                continue
+            try:
+                syncGameState(gs, moveIDs)
+            except ValueError:
+                responseQueue.put(("bestmove", requestID, None))
+                continue
+            ponder(gs, requestID, responseQueue, cancelledRequest, ponderHit, threads, book=book)
+
+
+def ponder(gs, requestID, responseQueue, cancelledRequest, ponderHit, threads=SEARCH_THREADS, timeLimit=TIME_LIMIT,
+           book=None):
+    """
+    Uses the opponent's thinking time. The reply expected from the opponent is the best move stored
+    in the transposition table; it is announced with ("ponder", requestID, moveID) on responseQueue and
+    the position after it is searched with no time limit.
+    If the opponent plays that move, the caller sets ponderHit.value to requestID ("ponderhit"): the
+    time spent pondering counts towards timeLimit, so the search stops soon after and answers
+    ("bestmove", requestID, moveID) as if it had been asked for then. Otherwise the caller cancels requestID and asks for a new search,
+    which starts with the transposition table already filled by the ponder search.
+    When no reply is expected, ("ponder", requestID, None) is sent and the opponent's own position is
+    searched instead, which fills the table for all of their replies until it is cancelled.
+
+    :param gs: the game state, with the opponent to move
+    :param requestID: the ID of the ponder request
+    :param responseQueue: a multiprocessing.Queue the answers are put into
+    :param cancelledRequest: a multiprocessing.Value holding the highest requestID which has been cancelled
+    :param ponderHit: a multiprocessing.Value holding the highest requestID whose expected reply was played
+    :param threads: the number of processes to search with
+    :param timeLimit: the number of seconds the search may take in total once there has been a ponderhit
+    :param book: a PolyglotBook whose move is played instead of searching when the expected reply leads into it
+    """
+    validMoves = gs.getValidMoves()
+    entry = transpositionTable.probe(gs.zobristKey)
+    expectedMove = None
+    if entry is not None:
+        for move in validMoves:
+            if move.moveID == entry[3]:
+                expectedMove = move
+    responseQueue.put(("ponder", requestID, expectedMove.moveID if expectedMove is not None else None))
+    cancelled = lambda: cancelledRequest.value >= requestID
+    returnQueue = queue.Queue()
+    if expectedMove is None:
+        findBestMoveParallel(gs, validMoves, returnQueue, threads, timeLimit=None, stopCheck=cancelled)
+        responseQueue.put(("bestmove", requestID, None))
+        return
+
+    def ponderStopCheck():
+        global searchDeadline
+        if ponderHit.value >= requestID and searchDeadline is None:
+            # ponderhit --> from now on this is a normal search which started when pondering did
+            searchDeadline = max(ponderStart + timeLimit, time.time() + PONDERHIT_MIN_TIME)
+        return cancelled()
+
+    ponderStart = time.time()
+    gs.makeMove(expectedMove)
+    nextMoves = gs.getValidMoves()
+    move = book.chooseMove(gs, nextMoves) if book is not None else None
+    if move is None:
+        findBestMoveParallel(gs, nextMoves, returnQueue, threads, timeLimit=None, stopCheck=ponderStopCheck)
+        move = returnQueue.get()
+    # a search which ended before the opponent moved (a forced mate, or MAX_DEPTH) waits for their move
+    while ponderHit.value < requestID and not cancelled():
+        time.sleep(PONDER_POLL_INTERVAL)
+    if cancelled():
+        move = None
+    responseQueue.put(("bestmove", requestID, move.moveID if move is not None else None))
+
+
+def getPrincipalVariation(gs, maxLength=MAX_DEPTH):
+    """
+    Follows the best moves stored in the transposition table from the current position
+
+    :param gs: the game state, which is left unchanged
+    :param maxLength: the most moves to follow
+    :return: the list of moves expected to be played from the position.
+    """
+    variation = []
+    seen = set()
+    while len(variation) < maxLength and gs.zobristKey not in seen:
+        seen.add(gs.zobristKey)
+        entry = transpositionTable.probe(gs.zobristKey)
+        if entry is None or entry[3] is None:
+            break
+        move = next((move for move in gs.getValidMoves() if move.moveID == entry[3]), None)
+        if move is None:
+            break
+        variation.append(move)
+        gs.makeMove(move)
+    for move in variation:
+        gs.undoMove()
+    return variation
+
+
+def syncGameState(gs, moveIDs):
+    """
+    Brings a game state to the position reached by playing moveIDs from the start, by taking back
+    moves until it shares a history with moveIDs and then playing the rest. Only the moves since the
+    last request are normally played, so the cost does not grow with the length of the game.
+
+    :param gs: the game state to update
+    :param moveIDs: the moveIDs of every move played from the starting position
+    :raises ValueError: if one of the moves is not legal, leaving gs at the position before it
+    """
+    common = 0
+    while common < len(gs.moveLog) and common < len(moveIDs) and gs.moveLog[common].moveID == moveIDs[common]:
+        common += 1
+    while len(gs.moveLog) > common:
+        gs.undoMove()
+    for moveID in moveIDs[common:]:
+        move = next((move for move in gs.getValidMoves() if move.moveID == moveID), None)
+        if move is None:
+            raise ValueError("illegal move %d in position %s" % (moveID, gs.getFen()))
+        gs.makeMove(move)
 
 
 def findMoveMinMax(gs, validMoves, depth, whiteToMove):
@@ -237,7 +1096,7 @@ def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier)
     loops through all the possible moves and calls itself on each move. It does this by first making the
     move, then recursively calling itself on the next set of moves. It then undoes the move, and checks
     to see if the score is greater than the current maximum score. If so, it sets the maximum score to
-    the score of the board, and if the depth is DEPTH (the original call), it sets the nextMove to the
+    the score of the board, and if the depth is searchDepth (the root call), it sets the nextMove to the
     move that resulted in the maximum score.
     
     :param gs: the game state
@@ -249,29 +1108,196 @@ def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier)
     :return: The score of the best move.
     """
     global nextMove, counter
-    counter += 1
     if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
+        # captures are played out until the position is quiet before it is scored
+        return quiescenceSearch(gs, validMoves, alpha, beta, turnMultiplier, searchDepth)
+    counter += 1
+    checkSearchBudget()
+    ply = searchDepth - depth
+
+    if not validMoves:
+        # checkmate or stalemate --> the side to move has lost, or it is a draw
+        return -(CHECKMATE - ply) if gs.checkmate else STALEMATE
+
+    if tablebases is not None and depth != searchDepth:
+        result = tablebases.probe(gs)
+        if result is not None:
+            return mateScoreFromTable(tablebaseScore(result), ply)
+
+    # a stored result which is at least as deep can end the search of this position straight away
+    originalAlpha = alpha
+    entry = transpositionTable.probe(gs.zobristKey)
+    ttMoveID = None
+    if entry is not None:
+        entryDepth, entryScore, entryFlag, ttMoveID = entry
+        entryScore = mateScoreFromTable(entryScore, ply)
+        if entryDepth >= depth and depth != searchDepth:  # the root must still choose nextMove
+            if entryFlag == EXACT:
+                return entryScore
+            elif entryFlag == LOWER_BOUND:
+                alpha = max(alpha, entryScore)
+            else:
+                beta = min(beta, entryScore)
+            if alpha >= beta:
+                return entryScore
+
+    validMoves = orderMoves(gs, validMoves, ply, ttMoveID)
+
     maxScore = -CHECKMATE
-    for move in validMoves:
+    bestMove = None
+    for i, move in enumerate(validMoves):
         gs.makeMove(move)
         nextMoves = gs.getValidMoves()
         score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth-1,-beta, -alpha, -turnMultiplier)
         if score > maxScore:
             maxScore = score
-            if depth == DEPTH:
+            bestMove = move
+            if depth == searchDepth:
                 nextMove = move
         gs.undoMove()
         if maxScore > alpha:
             alpha = maxScore
         if alpha >= beta:
+            orderingStats["cutoffs"] += 1
+            if i == 0:
+                orderingStats["firstMoveCutoffs"] += 1
+            recordCutoff(gs, move, depth, ply)
             break
+
+    if maxScore <= originalAlpha:
+        flag = UPPER_BOUND
+    elif maxScore >= beta:
+        flag = LOWER_BOUND
+    else:
+        flag = EXACT
+    transpositionTable.store(gs.zobristKey, depth, mateScoreToTable(maxScore, ply), flag,
+                             bestMove.moveID if bestMove is not None else None)
     return maxScore
 
 
+def mateScoreToTable(score, ply):
+    """
+    Converts a mate score counted from the root into one counted from the position at ply, so that a
+    stored result is right wherever the position is found again. Other scores are unchanged.
+    """
+    if score >= MATE_SCORE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_SCORE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def mateScoreFromTable(score, ply):
+    """
+    Converts a mate score counted from the position at ply (as stored, or from the tablebases) into
+    one counted from the root. Other scores are unchanged.
+    """
+    if score >= MATE_SCORE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_SCORE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def quiescenceSearch(gs, validMoves, alpha, beta, turnMultiplier, ply=0):
+    """
+    Searches captures only until the position is quiet, so that the search does not stop in the
+    middle of an exchange. The side to move may always "stand pat" and accept the static score
+    instead of capturing. Captures which lose material according to staticExchangeEvaluation are
+    not searched.
+
+    :param gs: the game state
+    :param validMoves: the list of valid moves for the current player
+    :param alpha: the best score we know we can achieve from this position
+    :param beta: the best score the opponent can achieve elsewhere
+    :param turnMultiplier: 1 if white's turn, -1 if black's turn
+    :param ply: how many plies the position is from the root of the search
+    :return: the score of the position once it is quiet
+    """
+    global counter
+    counter += 1
+    checkSearchBudget()
+    if gs.checkmate:
+        return -(CHECKMATE - ply)
+    if gs.stalemate:
+        return STALEMATE
+    standPat = turnMultiplier * scoreBoard(gs)
+    if standPat >= beta:
+        return standPat
+    if standPat > alpha:
+        alpha = standPat
+
+    captures = [move for move in validMoves if move.isCapture]
+    captures.sort(key=lambda move: 10 * pieceScore[move.pieceCaptured[1]] - pieceScore[move.pieceMoved[1]], reverse=True)
+    maxScore = standPat
+    for move in captures:
+        if staticExchangeEvaluation(gs, move) < 0:
+            continue
+        gs.makeMove(move)
+        nextMoves = gs.getValidMoves()
+        score = -quiescenceSearch(gs, nextMoves, -beta, -alpha, -turnMultiplier, ply + 1)
+        gs.undoMove()
+        if score > maxScore:
+            maxScore = score
+        if maxScore > alpha:
+            alpha = maxScore
+        if alpha >= beta:
+            break
+    return maxScore
+
+
+def staticExchangeEvaluation(gs, move):
+    """
+    Works out the material won or lost by a capture if both sides keep recapturing on the same square
+    with their least valuable attacker, and may stop whenever continuing would lose material.
+    Pieces behind the capturing ones are revealed as the exchange goes on because the board is
+    updated after each capture and restored at the end.
+
+    :param gs: the game state
+    :param move: a capture for the side to move
+    :return: the material gained by the side to move, in pieceScore units
+    """
+    victim = move.pieceCaptured[1]
+    attacker = move.pieceMoved[1]
+    if SEE_PIECE_VALUES[victim] >= SEE_PIECE_VALUES[attacker]:
+        return pieceScore[victim]  # can never lose material, whatever the recaptures are
+
+    board = gs.board
+    r, c = move.endRow, move.endCol
+    changes = [(move.startRow, move.startCol, board[move.startRow][move.startCol]), (r, c, board[r][c])]
+    if move.isEnpassantMove:
+        changes.append((move.startRow, move.endCol, board[move.startRow][move.endCol]))
+        board[move.startRow][move.endCol] = '--'
+    board[move.startRow][move.startCol] = '--'
+    board[r][c] = move.pieceMoved
+
+    # gains[i] = material won by the side making capture i if the exchange stopped after it
+    gains = [SEE_PIECE_VALUES[victim]]
+    colour = 'b' if move.pieceMoved[0] == 'w' else 'w'
+    while True:
+        attackers = ChessEngine.squareAttackers(board, r, c, colour)
+        if len(attackers) == 0:
+            break
+        ar, ac = min(attackers, key=lambda square: SEE_PIECE_VALUES[board[square[0]][square[1]][1]])
+        gains.append(SEE_PIECE_VALUES[board[r][c][1]] - gains[-1])
+        changes.append((ar, ac, board[ar][ac]))
+        board[r][c] = board[ar][ac]
+        board[ar][ac] = '--'
+        colour = 'b' if colour == 'w' else 'w'
+
+    for changedRow, changedCol, piece in reversed(changes):
+        board[changedRow][changedCol] = piece
+
+    # each side only recaptures if doing so is better than stopping
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
 def scoreBoard(gs):
     """
-    This function takes in a GameState object and returns a score for the state
+    This function takes in a GameState object and returns a score for the state.
+    The running totals kept by the game state are used when it has them.
     
     :param gs: the game state
     :return: The score of the board.
@@ -283,6 +1309,18 @@ def scoreBoard(gs):
             return CHECKMATE
     elif gs.stalemate:
         return STALEMATE
+    if gs.materialValues is not None:
+        return gs.materialScore + gs.positionScore * POSITION_WEIGHT
+    return scoreBoardFull(gs)
+
+
+def scoreBoardFull(gs):
+    """
+    Scores the board by scanning every square
+    
+    :param gs: the game state
+    :return: The score of the board, ignoring checkmate and stalemate.
+    """
     score = 0
     for row in range(len(gs.board)):
         for col in range(len(gs.board[row])):
@@ -295,11 +1333,36 @@ def scoreBoard(gs):
                     else:
                         piecePositionScore = piecePositionScores[square[1]][row][col]
                 if square[0] == 'w':
-                    score += pieceScore[square[1]] + piecePositionScore * .1
+                    score += pieceScore[square[1]] + piecePositionScore * POSITION_WEIGHT
                 elif square[0] == 'b':
-                    score -= pieceScore[square[1]] + piecePositionScore * .1
+                    score -= pieceScore[square[1]] + piecePositionScore * POSITION_WEIGHT
     return score
 
+
+def useIncrementalEvaluation(gs):
+    """
+    Makes the game state keep running evaluation totals with this module's tables, so that
+    scoreBoard is O(1)
+    
+    :param gs: the game state
+    """
+    if gs.materialValues is not materialValues or gs.positionValues is not positionValues:
+        gs.setEvaluation(materialValues, positionValues)
+
+
+def checkIncrementalEvaluation(gs, tolerance=1e-9):
+    """
+    Compares the running evaluation totals of a game state with a full scan of the board, for testing
+    
+    :param gs: the game state, which must be using incremental evaluation
+    :param tolerance: the largest difference allowed between the two scores
+    :return: True if the running totals match the full scan.
+    """
+    incremental = gs.materialScore + gs.positionScore * POSITION_WEIGHT
+    return (gs.materialScore, gs.positionScore) == gs.computeEvaluation() and \
+        abs(incremental - scoreBoardFull(gs)) <= tolerance
+
+
 def scoreMaterial(board):
     """
     Given a board, return the material score of the board
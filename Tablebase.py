@@ -0,0 +1,451 @@
+import argparse
+import mmap
+import os
+import time
+from array import array
+
+from ChessEngine import KING_ATTACKS, KNIGHT_ATTACKS, GameState, bishopAttacks, iterSquares, rookAttacks
+
+# Endgame tablebases for pawnless endings of up to four pieces, built by retrograde analysis.
+# A table holds one byte per position and side to move giving the distance to mate in plies (DTM)
+# with perfect play, and is read through mmap so that probing costs one index calculation.
+#
+# A table is named after its material, the pieces of one side and then the other, each starting
+# with the king and in PIECE_ORDER, e.g. "KQKR". The first side is called side A below. The file
+# holds every position with side A to move followed by every position with side B to move.
+#
+# Value of a position for the side to move:
+# 0 --> draw
+# 1-127 --> win, mating in that many plies
+# 128 + n --> loss, mated in n plies (128 is checkmated)
+# 255 --> illegal, the side which is not to move is in check
+
+DRAW = 0
+LOSS = 128
+ILLEGAL = 255
+MAX_DTM = 127
+
+PIECE_ORDER = "KQRBN"
+TABLEBASE_DIR = "tablebases"
+TABLE_EXTENSION = ".tb"
+MAX_PIECES = 4
+# material which can never be won, so it needs no table
+DRAWN_MATERIAL = ("KK", "KBK", "KNK")
+DEFAULT_TABLES = ("KQK", "KRK", "KQKQ", "KQKR", "KQKB", "KQKN", "KRKR", "KRKB", "KRKN", "KBBK", "KBNK", "KNNK")
+
+# Without pawns the board can be rotated and mirrored without changing the result, so side A's king
+# is always moved into this triangle (rows 4-7 are ranks 4-1): a1-d1-d4, 10 squares instead of 64.
+TRIANGLE_SQUARES = [r * 8 + c for r in range(7, 3, -1) for c in range(8) if 7 - r <= c <= 3]
+TRIANGLE_INDEX = {sq: i for i, sq in enumerate(TRIANGLE_SQUARES)}
+# the 8 symmetries of the board as square lookup tables
+TRANSFORMS = [[(r if not flipRows else 7 - r) * 8 + (c if not flipCols else 7 - c) if not swap else
+               (c if not flipRows else 7 - c) * 8 + (r if not flipCols else 7 - r)
+               for r in range(8) for c in range(8)]
+              for swap in (False, True) for flipRows in (False, True) for flipCols in (False, True)]
+# TRIANGLE_TRANSFORMS[sq] --> the symmetries which bring a king on sq into the triangle. A king on the
+# a1-d4 diagonal can be brought there two ways, so those positions have two indices with equal values.
+TRIANGLE_TRANSFORMS = [[t for t, transform in enumerate(TRANSFORMS) if transform[sq] in TRIANGLE_INDEX] for sq in range(64)]
+
+
+def tableSize(numPieces):
+    """Number of positions with one side to move in a table of numPieces pieces"""
+    return len(TRIANGLE_SQUARES) * 64 ** (numPieces - 1)
+
+
+def positionIndex(squares, t=None):
+    """
+    Index of a position in its table, from the squares of its pieces in table order
+
+    :param t: the symmetry to use, by default the first of TRIANGLE_TRANSFORMS
+    """
+    transform = TRANSFORMS[TRIANGLE_TRANSFORMS[squares[0]][0] if t is None else t]
+    index = TRIANGLE_INDEX[transform[squares[0]]]
+    for sq in squares[1:]:
+        index = index * 64 + transform[sq]
+    return index
+
+
+def positionIndices(squares):
+    """Every index of a position in its table"""
+    return {positionIndex(squares, t) for t in TRIANGLE_TRANSFORMS[squares[0]]}
+
+
+def decodeIndex(index, numPieces):
+    """The squares of the pieces of the position at index, in table order"""
+    squares = [0] * numPieces
+    for i in range(numPieces - 1, 0, -1):
+        index, squares[i] = divmod(index, 64)
+    squares[0] = TRIANGLE_SQUARES[index]
+    return squares
+
+
+def pieceAttacks(pieceType, sq, occupied):
+    """Bitboard of the squares a piece of pieceType ("K", "Q", "R", "B" or "N") on sq attacks"""
+    if pieceType == "K":
+        return KING_ATTACKS[sq]
+    if pieceType == "N":
+        return KNIGHT_ATTACKS[sq]
+    if pieceType == "R":
+        return rookAttacks(sq, occupied)
+    if pieceType == "B":
+        return bishopAttacks(sq, occupied)
+    return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+
+
+def splitMaterial(name):
+    """Splits a table name such as "KQKR" into the pieces of its two sides, ("KQ", "KR")"""
+    second = name.find("K", 1)
+    sides = (name[:second], name[second:])
+    if second < 1 or any(side.count("K") != 1 or "".join(sorted(side, key=PIECE_ORDER.index)) != side or
+                         not set(side) <= set(PIECE_ORDER) for side in sides):
+        raise ValueError("not a pawnless material name: " + name)
+    return sides
+
+
+def decodeValue(value):
+    """
+    :param value: a table byte
+    :return: a tuple of (result, dtm) where result is 1 for a win, 0 for a draw and -1 for a loss
+    of the side to move, or None for an illegal position.
+    """
+    if value == ILLEGAL:
+        return None
+    if value == DRAW:
+        return 0, 0
+    if value < LOSS:
+        return 1, value
+    return -1, value - LOSS
+
+
+class Tablebases():
+    """
+    The tables found in a directory, memory-mapped and probed by position
+    """
+
+    def __init__(self, directory=TABLEBASE_DIR):
+        """
+        :param directory: the directory holding the .tb files, or None for no tables
+        """
+        self.tables = {}
+        self.files = []
+        self.maxPieces = 2
+        if directory is None:
+            return
+        for fileName in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(fileName)
+            if extension != TABLE_EXTENSION:
+                continue
+            f = open(os.path.join(directory, fileName), "rb")
+            table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(table) != 2 * tableSize(len(name)):
+                raise ValueError("%s has the wrong size for its material" % fileName)
+            self.files.append(f)
+            self.addTable(name, table)
+
+    def addTable(self, name, table):
+        """Makes a table probable, either a mmap of its file or the bytes a build has just produced"""
+        splitMaterial(name)
+        self.tables[name] = table
+        self.maxPieces = max(self.maxPieces, len(name))
+
+    def close(self):
+        for table in self.tables.values():
+            if isinstance(table, mmap.mmap):
+                table.close()
+        for f in self.files:
+            f.close()
+        self.tables = {}
+        self.files = []
+
+    def lookup(self, pieces, sideToMove):
+        """
+        Looks up a position from its pieces
+
+        :param pieces: a tuple of two lists of (pieceType, square), one per side, each in PIECE_ORDER
+        :param sideToMove: 0 or 1, the index in pieces of the side to move
+        :return: the table byte of the position, or None if there is no table for its material.
+        """
+        names = ["".join(pieceType for pieceType, sq in side) for side in pieces]
+        if names[0] + names[1] in self.tables:
+            sideA = 0
+        elif names[1] + names[0] in self.tables:
+            sideA = 1
+        elif names[0] + names[1] in DRAWN_MATERIAL or names[1] + names[0] in DRAWN_MATERIAL:
+            return DRAW
+        else:
+            return None
+        name = names[sideA] + names[1 - sideA]
+        squares = [sq for pieceType, sq in pieces[sideA]] + [sq for pieceType, sq in pieces[1 - sideA]]
+        offset = 0 if sideToMove == sideA else tableSize(len(name))
+        return self.tables[name][offset + positionIndex(squares)]
+
+    def probe(self, gs):
+        """
+        Looks up the position of a game state
+
+        :param gs: the game state
+        :return: a tuple of (result, dtm) for the side to move as returned by decodeValue, or None if
+        the position has pawns, too many pieces, castling rights or no table.
+        """
+        board = gs.board
+        empty = 0
+        for row in board:
+            empty += row.count("--")
+        if 64 - empty > self.maxPieces or gs.currentCastlingRight:
+            return None
+        pieces = ([], [])
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece != "--":
+                    if piece[1] == "p":
+                        return None
+                    pieces[0 if piece[0] == "w" else 1].append((piece[1], r * 8 + c))
+        for side in pieces:
+            side.sort(key=lambda piece: PIECE_ORDER.index(piece[0]))
+        value = self.lookup(pieces, 0 if gs.whiteToMove else 1)
+        return decodeValue(value) if value is not None else None
+
+
+def subMaterials(name):
+    """The materials reached by capturing one piece (other than a king) in a table, with the side with pieces first"""
+    sides = splitMaterial(name)
+    materials = []
+    for side in (0, 1):
+        for i in range(1, len(sides[side])):
+            remaining = [sides[0], sides[1]]
+            remaining[side] = remaining[side][:i] + remaining[side][i + 1:]
+            if remaining[0] == "K":
+                remaining.reverse()
+            material = remaining[0] + remaining[1]
+            if material not in materials:
+                materials.append(material)
+    return materials
+
+
+def generateTable(name, tablebases, log=print):
+    """
+    Builds the table of a material by retrograde analysis. The checkmates are found first, then
+    every position which can reach a position lost for the opponent in one move is a win one ply
+    longer, and every position all of whose moves reach a position won for the opponent is a loss,
+    working back one ply at a time. Positions never reached are draws.
+    Captures leave the table, so their results are looked up in the tables of the smaller material,
+    which must already be in tablebases.
+
+    :param name: the material, e.g. "KQKR"
+    :param tablebases: the Tablebases holding every table in subMaterials(name)
+    :param log: function called with progress messages
+    :return: the table as a bytearray, side A to move followed by side B to move
+    """
+    sides = splitMaterial(name)
+    types = sides[0] + sides[1]
+    owners = [0] * len(sides[0]) + [1] * len(sides[1])
+    kingSlots = (0, len(sides[0]))
+    n = len(types)
+    size = tableSize(n)
+    startTime = time.time()
+
+    def isAttacked(target, squares, attacker, occupied):
+        for j in range(n):
+            if owners[j] == attacker and squares[j] >= 0 and pieceAttacks(types[j], squares[j], occupied) >> target & 1:
+                return True
+        return False
+
+    def generateMoves(squares, side, occupied, own):
+        # legal moves of side --> list of (squares after the move, True if it was a capture)
+        moves = []
+        for j in range(n):
+            if owners[j] != side:
+                continue
+            sq = squares[j]
+            for target in iterSquares(pieceAttacks(types[j], sq, occupied) & ~own):
+                newSquares = list(squares)
+                newSquares[j] = target
+                captured = False
+                if occupied >> target & 1:
+                    newSquares[squares.index(target)] = -1
+                    captured = True
+                newOccupied = occupied & ~(1 << sq) | 1 << target
+                if not isAttacked(newSquares[kingSlots[side]], newSquares, 1 - side, newOccupied):
+                    moves.append((newSquares, captured))
+        return moves
+
+    def captureValue(squares, side):
+        # table byte of the position after a capture, with the opponent of side to move
+        pieces = ([], [])
+        for j in range(n):
+            if squares[j] >= 0:
+                pieces[owners[j]].append((types[j], squares[j]))
+        value = tablebases.lookup(pieces, 1 - side)
+        if value is None:
+            raise ValueError("the tables for %s are needed to build %s" % (" ".join(subMaterials(name)), name))
+        return value
+
+    def bitboards(squares):
+        own = [0, 0]
+        for j in range(n):
+            own[owners[j]] |= 1 << squares[j]
+        return own[0] | own[1], own
+
+    values = (bytearray(size), bytearray(size))
+    # number of moves within the table which have not yet been found to lose, per position
+    counters = (array("h", bytes(2 * size)), array("h", bytes(2 * size)))
+    # longest loss found among the captures of a position
+    captureLosses = (bytearray(size), bytearray(size))
+    # set when a capture draws or wins, so the position can never be a loss
+    escapes = (bytearray(size), bytearray(size))
+    # buckets[ply] --> (side, index, value) of the positions found to be decided in that many plies
+    buckets = {}
+
+    def push(side, index, dtm, value):
+        if dtm > MAX_DTM:
+            raise ValueError("%s has a mate longer than %d plies" % (name, MAX_DTM))
+        buckets.setdefault(dtm, []).append((side, index, value))
+
+    # 1. classify every position by its own moves
+    for index in range(size):
+        squares = decodeIndex(index, n)
+        if len(set(squares)) < n:
+            values[0][index] = values[1][index] = ILLEGAL
+            continue
+        occupied, own = bitboards(squares)
+        inCheck = [isAttacked(squares[kingSlots[side]], squares, 1 - side, occupied) for side in (0, 1)]
+        for side in (0, 1):
+            if inCheck[1 - side]:
+                values[side][index] = ILLEGAL
+                continue
+            moves = generateMoves(squares, side, occupied, own[side])
+            if not moves:
+                if inCheck[side]:
+                    push(side, index, 0, LOSS)
+                continue  # stalemate is a draw
+            inTable = 0
+            bestWin = None
+            for newSquares, captured in moves:
+                if not captured:
+                    inTable += 1
+                    continue
+                result = decodeValue(captureValue(newSquares, side))
+                if result[0] == 0:
+                    escapes[side][index] = 1
+                elif result[0] < 0:
+                    bestWin = result[1] + 1 if bestWin is None else min(bestWin, result[1] + 1)
+                else:
+                    captureLosses[side][index] = max(captureLosses[side][index], result[1] + 1)
+            counters[side][index] = inTable
+            if bestWin is not None:
+                escapes[side][index] = 1
+                push(side, index, bestWin, bestWin)
+            elif inTable == 0 and not escapes[side][index]:
+                push(side, index, captureLosses[side][index], LOSS + captureLosses[side][index])
+    log("%s: %d positions classified in %.1fs" % (name, 2 * size, time.time() - startTime))
+
+    def lossLength(side, index):
+        # plies until side is mated if every move of the position has been found to lose, otherwise None
+        squares = decodeIndex(index, n)
+        occupied, own = bitboards(squares)
+        longest = captureLosses[side][index]
+        for newSquares, captured in generateMoves(squares, side, occupied, own[side]):
+            if captured:
+                continue
+            value = values[1 - side][positionIndex(newSquares)]
+            if value == DRAW or value >= LOSS:
+                return None
+            longest = max(longest, value + 1)
+        return longest
+
+    # 2. work back from the decided positions one ply at a time
+    ply = 0
+    while buckets:
+        for side, index, value in buckets.pop(ply, []):
+            if values[side][index]:
+                continue  # already decided in fewer plies
+            values[side][index] = value
+            # positions the other side could have reached this one from by a move which is not a capture
+            mover = 1 - side
+            squares = decodeIndex(index, n)
+            occupied, own = bitboards(squares)
+            for j in range(n):
+                if owners[j] != mover:
+                    continue
+                for origin in iterSquares(pieceAttacks(types[j], squares[j], occupied) & ~occupied):
+                    before = list(squares)
+                    before[j] = origin
+                    for previous in positionIndices(before):
+                        if values[mover][previous]:
+                            continue
+                        if value >= LOSS:
+                            push(mover, previous, ply + 1, ply + 1)
+                        else:
+                            # board symmetries can count the same move more than once, so a position whose
+                            # counter runs out is checked move by move before it is called a loss
+                            counters[mover][previous] -= 1
+                            if counters[mover][previous] <= 0 and not escapes[mover][previous]:
+                                length = lossLength(mover, previous)
+                                if length is not None:
+                                    push(mover, previous, length, LOSS + length)
+        ply += 1
+
+    table = values[0] + values[1]
+    wins = [value for value in table if 0 < value < LOSS]
+    losses = sum(1 for value in table if LOSS <= value < ILLEGAL)
+    log("%s: %d wins, %d losses, %d draws, longest mate %d plies, %.1fs" % (
+        name, len(wins), losses, len(table) - len(wins) - losses - table.count(ILLEGAL), max(wins, default=0),
+        time.time() - startTime))
+    return table
+
+
+def buildTables(names, directory=TABLEBASE_DIR, log=print):
+    """
+    Builds the tables of the given materials, and of the smaller materials they need, into directory.
+    Tables which are already in directory are used instead of being built again.
+
+    :param names: the materials to build, e.g. ["KQK", "KRK"]
+    :param directory: the directory the .tb files are written to
+    :param log: function called with progress messages
+    """
+    os.makedirs(directory, exist_ok=True)
+    tablebases = Tablebases(directory)
+
+    def build(name):
+        sides = splitMaterial(name)
+        if name in tablebases.tables or sides[1] + sides[0] in tablebases.tables or name in DRAWN_MATERIAL:
+            return
+        if len(name) > MAX_PIECES:
+            raise ValueError("tables of more than %d pieces are not supported: %s" % (MAX_PIECES, name))
+        for material in subMaterials(name):
+            build(material)
+        table = generateTable(name, tablebases, log)
+        with open(os.path.join(directory, name + TABLE_EXTENSION), "wb") as f:
+            f.write(table)
+        tablebases.addTable(name, table)
+
+    try:
+        for name in names:
+            build(name)
+    finally:
+        tablebases.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or probe pawnless endgame tablebases")
+    parser.add_argument("--dir", default=TABLEBASE_DIR, help="directory of the .tb files")
+    parser.add_argument("--build", nargs="*", metavar="MATERIAL",
+                        help="build these materials, e.g. KQK KRKN (default: %s)" % " ".join(DEFAULT_TABLES))
+    parser.add_argument("--probe", metavar="FEN", help="print the result of a position")
+    args = parser.parse_args()
+
+    if args.build is not None:
+        buildTables(args.build or DEFAULT_TABLES, args.dir)
+    if args.probe:
+        tablebases = Tablebases(args.dir)
+        result = tablebases.probe(GameState(args.probe))
+        if result is None:
+            print("not in the tablebases")
+        else:
+            print(("draw", "win", "loss")[result[0]] + ("" if result[0] == 0 else " in %d plies" % result[1]))
+        tablebases.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+import io
+import queue
+import random
+
+import pytest
+
+import ChessEngine
+import SmartMoveFinder
+from ChessUCI import UCIEngine, moveToUci, uciScore
+from MatchRunner import DEFAULT_OPENINGS
+from Perft import BACKENDS, DEFAULT_BACKEND, PERFT_SUITE, perft
+
+# Regression tests for the engine. Run with: python -m pytest -q
+
+# perft counts above this are left to Perft.py, so that the tests stay quick
+MAX_PERFT_NODES = 100000
+# positions the random games start from
+START_POSITIONS = [position["fen"] for position in PERFT_SUITE] + DEFAULT_OPENINGS
+
+
+def randomGame(gs, rng, plies):
+    # plays random legal moves until the game ends or the given number of plies have been made
+    for _ in range(plies):
+        moves = gs.getValidMoves()
+        if not moves:
+            break
+        gs.makeMove(rng.choice(moves))
+        yield gs
+
+
+def search(fen, maxDepth=4, nodeLimit=None):
+    # searches a position from an empty transposition table --> (move, lastSearchInfo)
+    SmartMoveFinder.transpositionTable.clear()
+    random.seed(0)
+    gs = BACKENDS[DEFAULT_BACKEND](fen)
+    returnQueue = queue.Queue()
+    SmartMoveFinder.findBestMove(gs, gs.getValidMoves(), returnQueue, None, nodeLimit, maxDepth)
+    return returnQueue.get(), SmartMoveFinder.lastSearchInfo
+
+
+def runUci(commands):
+    # sends commands to a UCI engine and waits for any search they start --> (engine, output lines)
+    SmartMoveFinder.transpositionTable.clear()
+    output = io.StringIO()
+    engine = UCIEngine(output)
+    for command in commands:
+        engine.handle(command)
+    if engine.searchThread is not None:
+        engine.searchThread.join()
+    return engine, output.getvalue().splitlines()
+
+
+def testBitboardBackendMatchesMailbox():
+    # both backends find the same legal moves, and the bitboards always describe the 8x8 board
+    rng = random.Random(3)
+    for position in PERFT_SUITE:
+        mailbox = ChessEngine.GameState(position["fen"])
+        bitboard = ChessEngine.BitboardGameState(position["fen"])
+        for _ in range(80):
+            moves = bitboard.getValidMoves()
+            assert sorted(m.moveID for m in moves) == sorted(m.moveID for m in mailbox.getValidMoves()), bitboard.getFen()
+            if not moves:
+                break
+            move = rng.choice(moves)
+            mailbox.makeMove(move)
+            bitboard.makeMove(move)
+            if rng.random() < 0.2:
+                mailbox.undoMove()
+                bitboard.undoMove()
+            fresh = ChessEngine.BitboardGameState(bitboard.getFen())
+            assert bitboard.pieceBitboards == fresh.pieceBitboards, bitboard.getFen()
+            assert bitboard.colourBitboards == fresh.colourBitboards, bitboard.getFen()
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+@pytest.mark.parametrize("position", PERFT_SUITE, ids=[position["name"] for position in PERFT_SUITE])
+def testPerftCounts(backend, position):
+    gs = BACKENDS[backend](position["fen"])
+    for depth, count in enumerate(position["counts"], 1):
+        if count > MAX_PERFT_NODES:
+            break
+        assert perft(gs, depth) == count, "depth %d" % depth
+    # perft must leave the position as it found it
+    assert gs.getFen() == position["fen"]
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def testZobristKeyMatchesRecomputedKey(backend):
+    rng = random.Random(1)
+    for fen in START_POSITIONS:
+        gs = BACKENDS[backend](fen)
+        keys = [gs.zobristKey]
+        for _ in randomGame(gs, rng, 60):
+            assert gs.zobristKey == gs.computeZobristKey(), gs.getFen()
+            keys.append(gs.zobristKey)
+        # undoing each move gives back the key the position had before it
+        while gs.moveLog:
+            keys.pop()
+            gs.undoMove()
+            assert gs.zobristKey == keys[-1] == gs.computeZobristKey()
+
+
+def testStalemateIsNotScoredAsMate():
+    # Qb6 stalemates the black king, which used to score as a mate for white
+    move, info = search("k7/8/8/1Q6/8/8/8/K7 w - - 0 1")
+    assert moveToUci(move) != "b5b6"
+    assert 0 < info["score"] < SmartMoveFinder.MATE_SCORE_THRESHOLD
+
+
+def testStalemateScore(monkeypatch):
+    gs = ChessEngine.GameState("k7/8/1Q6/8/8/8/8/K7 b - - 0 1")
+    assert gs.getValidMoves() == [] and gs.stalemate
+    monkeypatch.setattr(SmartMoveFinder, "searchDepth", 1)
+    monkeypatch.setattr(SmartMoveFinder, "counter", 0, raising=False)  # only set once a search has run
+    score = SmartMoveFinder.findMoveNegaMaxAlphaBeta(gs, [], 1, -SmartMoveFinder.CHECKMATE, SmartMoveFinder.CHECKMATE, -1)
+    assert score == SmartMoveFinder.STALEMATE
+
+
+@pytest.mark.parametrize("fen, plies", [
+    ("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", 1),  # back rank mate in 1
+    ("k7/8/2K5/8/8/8/8/7R w - - 0 1", 3),  # mate in 2
+])
+def testMateScoreCountsPlies(fen, plies):
+    move, info = search(fen)
+    # a quicker mate scores higher, so the search does not put off a mate it can already see
+    assert info["score"] == SmartMoveFinder.CHECKMATE - plies
+    gs = ChessEngine.GameState(fen)
+    gs.makeMove(move)
+    gs.getValidMoves()
+    assert gs.checkmate == (plies == 1)
+
+
+def testNodeLimitStillGivesAMove():
+    # the budget runs out before the first iteration finishes, which used to give no move at all
+    move, info = search(ChessEngine.START_FEN, nodeLimit=3)
+    assert move is not None
+    assert move.moveID in [m.moveID for m in ChessEngine.GameState().getValidMoves()]
+
+
+@pytest.mark.parametrize("score, expected", [
+    (SmartMoveFinder.CHECKMATE - 1, "mate 1"),
+    (SmartMoveFinder.CHECKMATE - 3, "mate 2"),
+    (SmartMoveFinder.CHECKMATE - 5, "mate 3"),
+    (-(SmartMoveFinder.CHECKMATE - 2), "mate -1"),
+    (-(SmartMoveFinder.CHECKMATE - 4), "mate -2"),
+    (0.5, "cp 50"),
+    (-1.25, "cp -125"),
+])
+def testUciScore(score, expected):
+    assert uciScore(score) == expected
+
+
+@pytest.mark.parametrize("moves, mateIn", [("", 2), (" moves c6b6 a8b8", 1)])
+def testUciReportsMateDistance(moves, mateIn):
+    engine, lines = runUci(["position fen k7/8/2K5/8/8/8/8/7R w - - 0 1" + moves, "go depth 4"])
+    info = [line for line in lines if line.startswith("info depth")]
+    assert info and " score mate %d " % mateIn in info[-1]
+    assert lines[-1].startswith("bestmove ")
+
+
+@pytest.mark.parametrize("badMove", ["e1e3", "zz"])
+def testUciIgnoresMovesAfterAnIllegalOne(badMove):
+    engine, lines = runUci(["position startpos moves e2e4 e7e5 %s d2d4" % badMove])
+    assert lines == ["info string illegal move %s, ignoring it and the moves after it" % badMove]
+    assert [moveToUci(move) for move in engine.gs.moveLog] == ["e2e4", "e7e5"]
+    # the engine keeps going from the position before the illegal move
+    engine, lines = runUci(["position startpos moves e2e4 e7e5 %s" % badMove, "go depth 2"])
+    assert lines[-1].startswith("bestmove ")
+
+
+def testFenRoundTrip():
+    rng = random.Random(2)
+    for fen in START_POSITIONS:
+        assert ChessEngine.GameState(fen).getFen() == fen
+        gs = ChessEngine.GameState(fen)
+        for _ in randomGame(gs, rng, 40):
+            copy = ChessEngine.GameState(gs.getFen())
+            assert copy.getFen() == gs.getFen()
+            assert copy.board == gs.board
+            assert copy.zobristKey == gs.zobristKey
+            assert sorted(m.moveID for m in copy.getValidMoves()) == sorted(m.moveID for m in gs.getValidMoves())
+
+
+def testFenWithoutCountersStartsAtMoveOne():
+    gs = ChessEngine.GameState("k7/8/8/8/8/8/8/K7 b - -")
+    assert gs.getFen() == "k7/8/8/8/8/8/8/K7 b - - 0 1"
+
+
+BAD_FENS = [
+    "k7/8/8/8/8/8/8/K7 w -",  # missing field
+    "k7/8/8/8/8/8/8/K6 w - - 0 1",  # short rank
+    "k7/8/8/8/8/8/8/K7/8 w - - 0 1",  # nine ranks
+    "k7/8/8/8/8/8/8/X7 w - - 0 1",  # unknown piece
+    "8/8/8/8/8/8/8/K7 w - - 0 1",  # no black king
+    "k7/8/8/8/8/8/8/K7 x - - 0 1",  # side to move
+    "k7/8/8/8/8/8/8/K7 w KZ - 0 1",  # castling right
+    "k7/8/8/8/8/8/8/K7 w - e9 0 1",  # en passant square off the board
+    "k7/8/8/8/8/8/8/K7 w - e3 0 1",  # en passant square on the wrong rank for the side to move
+    "k7/8/8/8/8/8/8/K7 w - - x 1",  # move counter
+]
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+@pytest.mark.parametrize("fen", BAD_FENS)
+def testBadFenRaisesValueError(backend, fen):
+    with pytest.raises(ValueError):
+        BACKENDS[backend](fen)
+
+
+def testUciReportsBadFen():
+    engine, lines = runUci(["position startpos moves e2e4", "position fen " + BAD_FENS[6]])
+    assert lines == ["info string bad position: unknown castling right 'Z' in FEN: " + BAD_FENS[6]]
+    # the engine keeps the last position it was sent
+    assert [moveToUci(move) for move in engine.gs.moveLog] == ["e2e4"]